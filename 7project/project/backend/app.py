@@ -7,7 +7,7 @@ import os
 from routes.health import health_bp
 from routes.data import data_bp
 from routes.main import main_bp
-from db import get_connection
+from db import get_connection, close_db
 from database.migrations import ensure_schema
 import time
 import logging
@@ -34,6 +34,9 @@ app.register_blueprint(health_bp)
 app.register_blueprint(data_bp)
 app.register_blueprint(main_bp) #For now saving index and about htmls.
 
+# One pooled DB connection per request, released (or rolled back) on teardown
+app.teardown_appcontext(close_db)
+
 # Optional server-side sessions via Redis when configured
 try:
     redis_client = get_redis()
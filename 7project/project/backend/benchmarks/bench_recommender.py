@@ -0,0 +1,65 @@
+"""Microbenchmark: per-request recommendation latency, full scan vs KD-tree.
+
+Runs once with the numeric features only and once with the text channel on
+(RECOMMENDER_TEXT_WEIGHT default), over synthetic titles and descriptions.
+
+Run from the backend directory:
+    python -m benchmarks.bench_recommender [rows]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from recommender import CONDITION_CODES, DEFAULT_TEXT_WEIGHT, FeatureIndex  # noqa: E402
+
+BRANDS = ['Trek', 'Giant', 'Cube', 'Specialized', 'Btwin', 'Scott', 'Canyon', 'Merida', 'Orbea', 'Bianchi']
+
+
+def make_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    sale_types = ['venta', 'alquiler', 'ambos']
+    conditions = list(CONDITION_CODES)
+    prices = rng.uniform(50, 5000, n)
+    lats = rng.uniform(57, 71, n)
+    lons = rng.uniform(4, 31, n)
+    brands = rng.integers(0, len(BRANDS), n)
+    models = rng.integers(0, 300, n)
+    # description words drawn from a long-tailed vocabulary, like real listings
+    words = rng.zipf(1.3, (n, 6)) % 20000
+    return [
+        (i, prices[i], prices[i] * 0.15, sale_types[i % 3], conditions[i % 5], lats[i], lons[i],
+         f'{BRANDS[brands[i]]} model{models[i]}', f'{BRANDS[brands[i]]} model{models[i]}',
+         ' '.join(f'w{w}' for w in words[i]))
+        for i in range(n)
+    ]
+
+
+def per_query_ms(index, mode, queries):
+    os.environ['RECOMMENDER_INDEX'] = mode
+    index.similar(int(queries[0]))  # builds the tree on first use
+    start = time.perf_counter()
+    for bike_id in queries:
+        index.similar(int(bike_id))
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = make_rows(n)
+    queries = np.random.default_rng(1).integers(0, n, 200)
+    for label, weight in (('numeric', '0'), ('numeric+text', str(DEFAULT_TEXT_WEIGHT))):
+        os.environ['RECOMMENDER_TEXT_WEIGHT'] = weight
+        index = FeatureIndex.build(rows)
+        brute = per_query_ms(index, 'brute', queries)
+        tree = per_query_ms(index, 'kdtree', queries)
+        print(f'{n} bikes, {label:<12}: full scan {brute:.3f} ms/query, KD-tree {tree:.3f} ms/query, '
+              f'speedup x{brute / tree:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Microbenchmark: legacy per-row dict building + stdlib JSON vs RowPlan + dumps.
+
+Run from the backend directory:
+    python -m benchmarks.bench_serialization [rows]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from serialization import RowPlan, dumps, orjson, to_float, to_iso  # noqa: E402
+
+
+def make_rows(n):
+    now = datetime.now(timezone.utc)
+    return [
+        (i, f'Bike {i}', Decimal('350.00'), Decimal('52.50'), 'ambos', 'Trek Marlin 5',
+         'Great condition, barely used', 'Like new', now, i % 50, f'user{i % 50}',
+         'https://images.unsplash.com/photo-1518650820938-039f23f89c79?w=800&q=80',
+         'Stavanger', Decimal('58.97'), Decimal('5.73'))
+        for i in range(n)
+    ]
+
+
+def legacy_dicts(rows):
+    # what routes/data.py did before the RowPlan refactor
+    bikes = []
+    for row in rows:
+        created_val = row[8]
+        created_str = created_val.isoformat() if hasattr(created_val, 'isoformat') else str(created_val) if created_val else None
+        bikes.append({
+            'id': row[0], 'title': row[1],
+            'sale_price': float(row[2]) if row[2] is not None else None,
+            'rental_price': float(row[3]) if row[3] is not None else None,
+            'sale_type': row[4], 'model': row[5], 'description': row[6], 'condition': row[7],
+            'created_at': created_str, 'owner_id': row[9], 'owner_name': row[10], 'image_url': row[11],
+            'location_name': row[12],
+            'latitude': float(row[13]) if row[13] is not None else None,
+            'longitude': float(row[14]) if row[14] is not None else None,
+        })
+    return bikes
+
+
+def legacy(rows):
+    # legacy dicts + Flask's sorted stdlib encoder
+    bikes = legacy_dicts(rows)
+    return json.dumps({'bikes': bikes, 'count': len(bikes)}, sort_keys=True).encode('utf-8')
+
+
+PLAN = RowPlan([
+    ('id', None), ('title', None), ('sale_price', to_float), ('rental_price', to_float),
+    ('sale_type', None), ('model', None), ('description', None), ('condition', None),
+    ('created_at', to_iso), ('owner_id', None), ('owner_name', None), ('image_url', None),
+    ('location_name', None), ('latitude', to_float), ('longitude', to_float),
+])
+
+
+def planned(rows):
+    bikes = PLAN.many(rows)
+    return dumps({'bikes': bikes, 'count': len(bikes)})
+
+
+def best_of(fn, rows, repeat=15):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rows = make_rows(n)
+    assert json.loads(legacy(rows)) == json.loads(planned(rows))
+    # row -> dict step on its own, then the whole response body
+    old = best_of(legacy_dicts, rows)
+    new = best_of(PLAN.many, rows)
+    print(f'{n} rows, dicts only: legacy {old * 1000:.1f} ms, RowPlan {new * 1000:.1f} ms, speedup x{old / new:.2f}')
+    old = best_of(legacy, rows)
+    new = best_of(planned, rows)
+    encoder = 'orjson' if orjson is not None else 'stdlib json'
+    print(f'{n} rows, with JSON: legacy {old * 1000:.1f} ms, RowPlan + {encoder} {new * 1000:.1f} ms, speedup x{old / new:.2f}')
+
+
+if __name__ == '__main__':
+    main()
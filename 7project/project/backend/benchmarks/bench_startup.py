@@ -0,0 +1,77 @@
+"""Startup cost of a gunicorn worker: `import app` time and resident memory.
+
+gunicorn runs without --preload, so every worker imports app itself and pays
+this once per boot. Each scenario runs in fresh interpreters (median of
+--runs):
+
+  before       app plus what routes/data.py used to import up front
+               (sklearn.metrics.pairwise, recommender, scipy.spatial)
+  after        app alone; recommender is imported on first use
+  after+recs   app, then recommender as the first recommendation request does
+
+Run from the backend directory (no database or Redis needed):
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+SCENARIOS = {
+    'before': ['sklearn.metrics.pairwise', 'recommender', 'scipy.spatial'],
+    'after': [],
+    'after+recs': ['recommender'],
+}
+
+_CHILD = """
+import importlib, resource, time
+start = time.perf_counter()
+import app
+for name in {extra!r}:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - start
+rss_kb = None
+try:
+    with open('/proc/self/status') as f:
+        rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+except OSError:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # peak, KB on Linux
+print(elapsed, rss_kb)
+"""
+
+
+def measure(extra):
+    """(seconds, RSS in KB) for one fresh interpreter."""
+    env = dict(os.environ, MIGRATE_ON_START='false', REDIS_URL='', REDIS_HOST='')
+    out = subprocess.run(
+        [sys.executable, '-c', _CHILD.format(extra=extra)],
+        cwd=BACKEND, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    seconds, rss_kb = out.stdout.split()[-2:]
+    return float(seconds), int(rss_kb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, extra in SCENARIOS.items():
+        try:
+            samples = [measure(extra) for _ in range(args.runs)]
+        except RuntimeError as exc:
+            print(f'{name:<11} skipped ({exc})')
+            continue
+        seconds = statistics.median(s for s, _ in samples)
+        rss_mb = statistics.median(r for _, r in samples) / 1024
+        print(f'{name:<11} import {seconds * 1000:7.1f} ms   RSS {rss_mb:6.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
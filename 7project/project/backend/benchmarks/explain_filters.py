@@ -0,0 +1,195 @@
+"""EXPLAIN check: every listing filter shape should be served by an index.
+
+Seeds the configured database (DB_URL for PostgreSQL, DB_HOST/... for MySQL)
+with synthetic bikes, runs the migrations, then EXPLAINs the first page of
+GET /api/bikes for each filter shape, built with the same _bike_filters() the
+route uses. Exits non-zero when a shape falls back to a full table scan or
+misses the index listed for it in REQUIRED_INDEXES.
+
+Run from the backend directory, against a throwaway database:
+    python -m benchmarks.explain_filters [--rows 1000000] [--keep]
+
+Seeded rows are tagged in `description` and removed again unless --keep.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from flask import Flask  # noqa: E402
+
+from database.migrations import ensure_schema  # noqa: E402
+from db import connection, is_postgres  # noqa: E402
+from routes.data import (  # noqa: E402
+    DEFAULT_PAGE_SIZE, _bike_filters, _listing_order_sql, _listing_sort_key, _near_args, _sort_arg,
+)
+
+SEED_TAG = 'explain_filters seed'
+
+# query strings exercised against GET /api/bikes
+SHAPES = [
+    '',
+    'type=venta',
+    'type=alquiler',
+    'type=venta&minSalePrice=100&maxSalePrice=150',
+    'type=alquiler&minRentalPrice=10&maxRentalPrice=12',
+    'minSalePrice=100&maxSalePrice=110&minRentalPrice=10&maxRentalPrice=11',
+    'owner=2',
+    'search=marlin',
+    'type=venta&search=trek+marlin',
+    'near=58.97,5.73&radius_km=5',
+]
+
+# shapes that must not just avoid a full scan but go through a specific index
+REQUIRED_INDEXES = {
+    'search=marlin': {'postgres': 'idx_bikes_search_tsv', 'mysql': 'ft_bikes_search'},
+    'type=venta&search=trek+marlin': {'postgres': 'idx_bikes_search_tsv', 'mysql': 'ft_bikes_search'},
+}
+
+_PG_SEED = """
+INSERT INTO bikes (title, model, description, sale_type, sale_price, rental_price, created_at, latitude, longitude)
+SELECT 'Bike ' || g,
+       (ARRAY['Trek Marlin 5', 'Giant TCR', 'Btwin City 500', 'Specialized Turbo'])[1 + g %% 4],
+       %s,
+       t,
+       CASE WHEN t <> 'alquiler' THEN 50 + (g * 37) %% 2000 END,
+       CASE WHEN t <> 'venta' THEN 5 + (g * 13) %% 300 END,
+       NOW() - g * INTERVAL '1 second',
+       56 + (g %% 1000) / 250.0,
+       4 + ((g * 7) %% 1000) / 125.0
+FROM (SELECT g, (ARRAY['venta', 'alquiler', 'ambos'])[1 + g %% 3] AS t
+      FROM generate_series(1, %s) AS g) s
+"""
+
+
+def _mysql_seed_sql(rows):
+    # no generate_series: cross join a 0-9 digits table once per decimal place
+    places = max(1, len(str(rows - 1)))
+    digits = "(SELECT 0 n UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 " \
+             "UNION ALL SELECT 5 UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9)"
+    number = ' + '.join(f"d{i}.n * {10 ** i}" for i in range(places))
+    joins = ', '.join(f"{digits} d{i}" for i in range(places))
+    return f"""
+        INSERT INTO bikes (title, model, description, sale_type, sale_price, rental_price, created_at, latitude, longitude)
+        SELECT CONCAT('Bike ', g),
+               ELT(1 + g %% 4, 'Trek Marlin 5', 'Giant TCR', 'Btwin City 500', 'Specialized Turbo'),
+               %s,
+               t,
+               IF(t <> 'alquiler', 50 + (g * 37) %% 2000, NULL),
+               IF(t <> 'venta', 5 + (g * 13) %% 300, NULL),
+               NOW() - INTERVAL g SECOND,
+               56 + (g %% 1000) / 250.0,
+               4 + ((g * 7) %% 1000) / 125.0
+        FROM (SELECT g, ELT(1 + g %% 3, 'venta', 'alquiler', 'ambos') AS t
+              FROM (SELECT {number} AS g FROM {joins}) nums WHERE g < %s) s
+    """
+
+
+def seed(conn, rows):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM bikes WHERE description = %s", (SEED_TAG,))
+    have = cur.fetchone()[0]
+    if have >= rows:
+        print(f'{have} seeded rows already present')
+        return
+    missing = rows - have
+    print(f'seeding {missing} bikes...', flush=True)
+    if is_postgres(conn):
+        cur.execute(_PG_SEED, (SEED_TAG, missing))
+        conn.commit()
+        cur.execute("ANALYZE bikes")
+    else:
+        cur.execute(_mysql_seed_sql(missing), (SEED_TAG, missing))
+        conn.commit()
+        cur.execute("ANALYZE TABLE bikes")
+        cur.fetchall()
+    conn.commit()
+
+
+def unseed(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM bikes WHERE description = %s", (SEED_TAG,))
+    conn.commit()
+
+
+def listing_query(app, conn, query_string):
+    """
+    First-page SQL of GET /api/bikes?<query_string>, LIMIT page + 1, in the
+    route's order: relevance first for search=, distance first for near=.
+    """
+    with app.test_request_context(f'/api/bikes?{query_string}'):
+        near = _near_args()
+        sort = _sort_arg(near)
+        where, params, rank = _bike_filters(conn)
+    sort_key = _listing_sort_key(sort, near, rank)
+    sql = "SELECT b.id"
+    select_params = []
+    if sort_key:
+        sql += f", {sort_key[0]} AS sort_key"
+        select_params.extend(sort_key[1])
+    sql += " FROM bikes b LEFT JOIN users u ON b.owner_id = u.id"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += _listing_order_sql(sort_key) + " LIMIT %s"
+    return sql, select_params + params + [DEFAULT_PAGE_SIZE + 1]
+
+
+def _pg_plan(cur, sql, params):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes, stack = [], [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.get('Plans', []))
+    indexes = sorted({n['Index Name'] for n in nodes if 'Index Name' in n})
+    full_scan = any(n['Node Type'] == 'Seq Scan' and n.get('Relation Name') == 'bikes' for n in nodes)
+    return indexes, full_scan
+
+
+def _mysql_plan(cur, sql, params):
+    cur.execute("EXPLAIN " + sql, params)
+    columns = [d[0] for d in cur.description]
+    rows = [dict(zip(columns, r)) for r in cur.fetchall()]
+    # b is the listing itself; bikes / b2 are the search= union branches
+    bikes = [r for r in rows if r.get('table') in ('b', 'b2', 'bikes')]
+    indexes = sorted({r['key'] for r in bikes if r.get('key')})
+    full_scan = any(r.get('type') == 'ALL' for r in bikes)
+    return indexes, full_scan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--keep', action='store_true', help='leave the seeded rows in place')
+    args = parser.parse_args()
+
+    ensure_schema()
+    app = Flask(__name__)
+    failures = 0
+    with connection() as conn:
+        seed(conn, args.rows)
+        backend = 'postgres' if is_postgres(conn) else 'mysql'
+        explain = _pg_plan if backend == 'postgres' else _mysql_plan
+        cur = conn.cursor()
+        try:
+            for shape in SHAPES:
+                sql, params = listing_query(app, conn, shape)
+                indexes, full_scan = explain(cur, sql, params)
+                required = REQUIRED_INDEXES.get(shape, {}).get(backend)
+                ok = bool(indexes) and not full_scan and (required is None or required in indexes)
+                failures += not ok
+                print(f"{'ok  ' if ok else 'FAIL'} {shape or '(no filters)':<75} {', '.join(indexes) or 'full scan'}")
+            conn.rollback()
+        finally:
+            if not args.keep:
+                unseed(conn)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
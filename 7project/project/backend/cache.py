@@ -0,0 +1,159 @@
+"""Redis response cache for catalogue reads.
+
+Entries are keyed by a hash of the normalised request parameters plus the
+catalogue version, a counter that every bike write bumps; old entries are
+never deleted explicitly, they just stop being addressed and expire via TTL.
+Every helper degrades to a no-op when Redis is unconfigured or unreachable.
+"""
+import hashlib
+import json
+import logging
+import os
+
+from redis_client import get_redis
+
+CATALOG_VERSION_KEY = 'bikes:catalog_version'
+# bikes:change:<version> -> id of the bike whose write produced that version
+CHANGE_KEY_PREFIX = 'bikes:change:'
+CHANGE_TTL = 3600
+# longer runs of changes are cheaper to rebuild from than to replay
+MAX_REPLAY = 1000
+STATS_KEY = 'cache:stats'
+
+_UNSET = object()
+_client = _UNSET
+
+
+def _redis():
+    # one client per process; redis-py's pool re-creates its sockets after fork
+    global _client
+    if _client is _UNSET:
+        try:
+            _client = get_redis()
+        except Exception:
+            _client = None
+    return _client
+
+
+def default_ttl() -> int:
+    try:
+        return int(os.getenv('BIKES_CACHE_TTL', '300'))
+    except ValueError:
+        return 300
+
+
+def catalog_version():
+    """Current catalogue version, or None when the cache is unavailable."""
+    r = _redis()
+    if r is None:
+        return None
+    try:
+        return int(r.get(CATALOG_VERSION_KEY) or 0)
+    except Exception as exc:
+        logging.debug('cache: version lookup failed: %s', exc)
+        return None
+
+
+def bump_catalog_version(bike_id=None):
+    """
+    Invalidate every cached catalogue response (call after bike writes) and
+    log bike_id as the change behind the new version (see catalog_changes).
+    Returns the new version, or None when the cache is unavailable.
+    """
+    r = _redis()
+    if r is None:
+        return None
+    try:
+        version = int(r.incr(CATALOG_VERSION_KEY))
+    except Exception as exc:
+        logging.warning('cache: could not bump catalogue version: %s', exc)
+        return None
+    if bike_id is not None:
+        try:
+            r.set(f'{CHANGE_KEY_PREFIX}{version}', bike_id, ex=CHANGE_TTL)
+        except Exception as exc:
+            # readers see a gap at this version and rebuild instead of replaying
+            logging.warning('cache: could not log catalogue change: %s', exc)
+    return version
+
+
+def catalog_changes(since, until):
+    """
+    Bike ids changed between catalogue versions `since` (exclusive) and
+    `until` (inclusive), oldest first, in one MGET.
+    Returns (ids, reached): `reached` is the last version the ids cover, which
+    falls short of `until` while the newest entries are still being written.
+    Returns None when the log cannot bring `since` up to date: a version
+    expired or was never logged, Redis was reset, or the run is longer than
+    MAX_REPLAY.
+    """
+    r = _redis()
+    if r is None or since is None or until is None or not 0 <= until - since <= MAX_REPLAY:
+        return None
+    if until == since:
+        return [], until
+    try:
+        values = r.mget([f'{CHANGE_KEY_PREFIX}{v}' for v in range(since + 1, until + 1)])
+    except Exception as exc:
+        logging.debug('cache: change log lookup failed: %s', exc)
+        return None
+    # a writer bumps the version just before logging its change: missing
+    # entries at the tail are in flight, missing entries before a logged one are lost
+    known = len(values)
+    while known and values[known - 1] is None:
+        known -= 1
+    if any(value is None for value in values[:known]):
+        return None
+    return [int(value) for value in values[:known]], since + known
+
+
+def make_key(namespace, params, version):
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+    return f'{namespace}:v{version}:{digest}'
+
+
+def get(key):
+    """Cached bytes for key (None on miss); counts the lookup in the same round trip."""
+    r = _redis()
+    if r is None:
+        return None
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.hincrby(STATS_KEY, 'lookups', 1)
+        body, _ = pipe.execute()
+        return body
+    except Exception as exc:
+        logging.debug('cache: get failed: %s', exc)
+        return None
+
+
+def put(key, body, ttl=None):
+    """Store body under key; only misses get stored, so this is where they are counted."""
+    r = _redis()
+    if r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.set(key, body, ex=ttl or default_ttl())
+        pipe.hincrby(STATS_KEY, 'misses', 1)
+        pipe.execute()
+    except Exception as exc:
+        logging.debug('cache: set failed: %s', exc)
+
+
+def stats():
+    r = _redis()
+    if r is None:
+        return None
+    raw = r.hgetall(STATS_KEY) or {}
+    total = int(raw.get(b'lookups', 0))
+    misses = min(int(raw.get(b'misses', 0)), total)
+    hits = total - misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'catalog_version': catalog_version(),
+    }
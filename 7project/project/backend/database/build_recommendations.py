@@ -0,0 +1,88 @@
+"""Precompute "similar bikes" for the whole catalogue.
+
+Encodes every bike once, runs the recommender's batched top-k over all of
+them and rewrites bike_recommendations in a single transaction, so readers
+keep seeing the previous run until this one commits. get_recommendations()
+then serves covered bikes with a primary-key lookup and computes only bikes
+newer than the run live.
+
+    python -m database.build_recommendations [--k 3] [--threshold 0.5] [--batch-size 1000]
+"""
+import argparse
+import sys
+import time
+
+import recommender
+from database.init_db_pg import wait_for_db
+from database.migrations import ensure_schema
+from db import is_postgres
+
+INSERT_SQL = "INSERT INTO bike_recommendations (bike_id, rec_rank, recommended_id, similarity) VALUES (%s, %s, %s, %s)"
+
+
+def _insert(conn, cur, rows):
+    if not rows:
+        return
+    if is_postgres(conn):
+        from psycopg2.extras import execute_values
+        execute_values(
+            cur,
+            "INSERT INTO bike_recommendations (bike_id, rec_rank, recommended_id, similarity) VALUES %s",
+            rows,
+            page_size=1000,
+        )
+    else:
+        # mysql-connector folds executemany INSERTs into multi-row statements
+        cur.executemany(INSERT_SQL, rows)
+
+
+def build(conn, k, threshold, batch_size=1000):
+    """Recompute and store the neighbours. Returns (bikes, rows written)."""
+    index = recommender.build_index(conn)
+    ids = [int(i) for i in index.ids[:index.size]]
+    cur = conn.cursor()
+    cur.execute("DELETE FROM bike_recommendations")
+    written = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        similar = index.similar_many(batch, k=k, threshold=threshold)
+        rows = [
+            (bike_id, rank, rec_id, similarity)
+            for bike_id in batch
+            for rank, (rec_id, similarity) in enumerate(similar[bike_id])
+        ]
+        _insert(conn, cur, rows)
+        written += len(rows)
+    # bikes indexed above are exactly the ones this run covers
+    cur.execute(
+        "INSERT INTO bike_recommendation_runs (max_bike_id, k, threshold) VALUES (%s, %s, %s)",
+        (max(ids, default=0), k, threshold),
+    )
+    conn.commit()
+    return len(ids), written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompute bike_recommendations.')
+    parser.add_argument('--k', type=int, default=recommender.default_k())
+    parser.add_argument('--threshold', type=float, default=recommender.default_threshold())
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+    k = max(1, min(args.k, recommender.MAX_K))
+
+    conn = wait_for_db()
+    ensure_schema()  # creates the tables on databases that predate them
+    started = time.monotonic()
+    try:
+        bikes, written = build(conn, k, args.threshold, args.batch_size)
+    except Exception as exc:
+        conn.rollback()
+        print(f'❌ Building recommendations failed: {exc}', file=sys.stderr)
+        raise
+    finally:
+        conn.close()
+    print(f'✅ {written} recommendations for {bikes} bikes (k={k}) in {time.monotonic() - started:.1f}s.')
+
+
+if __name__ == '__main__':
+    main()
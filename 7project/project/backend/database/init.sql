@@ -17,7 +17,14 @@ CREATE TABLE IF NOT EXISTS bikes (
     bike_condition VARCHAR(100),
     image_url VARCHAR(255),
     owner_id INT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    -- listing order, profile listings and the type / price filters
+    INDEX idx_bikes_created_at_id (created_at, id),
+    INDEX idx_bikes_owner_created_at (owner_id, created_at),
+    INDEX idx_bikes_sale_type_created_at (sale_type, created_at, id),
+    INDEX idx_bikes_sale_price (sale_price),
+    INDEX idx_bikes_rental_price (rental_price)
 );
 
 -- Seed users
@@ -46,5 +53,40 @@ CREATE TABLE IF NOT EXISTS messages (
     FOREIGN KEY (sender_id) REFERENCES users(id) ON DELETE CASCADE,
     FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE,
     INDEX idx_bike_messages (bike_id, created_at),
-    INDEX idx_user_messages (sender_id, receiver_id)
+    INDEX idx_user_messages (sender_id, receiver_id),
+    INDEX idx_messages_sender_created_at (sender_id, created_at),
+    INDEX idx_messages_receiver_created_at (receiver_id, created_at)
+);
+
+-- Conversation list: newest message per (bike, user pair), upserted by send_message()
+CREATE TABLE IF NOT EXISTS conversations (
+    bike_id INT NOT NULL,
+    user_low INT NOT NULL,
+    user_high INT NOT NULL,
+    last_message_id INT NOT NULL,
+    last_message TEXT NOT NULL,
+    last_message_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (bike_id, user_low, user_high),
+    INDEX idx_conversations_user_low (user_low, last_message_at),
+    INDEX idx_conversations_user_high (user_high, last_message_at),
+    FOREIGN KEY (bike_id) REFERENCES bikes(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_low) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_high) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Precomputed neighbours (database/build_recommendations.py)
+CREATE TABLE IF NOT EXISTS bike_recommendations (
+    bike_id BIGINT NOT NULL,
+    rec_rank SMALLINT NOT NULL,
+    recommended_id BIGINT NOT NULL,
+    similarity DOUBLE NOT NULL,
+    PRIMARY KEY (bike_id, rec_rank)
+);
+
+CREATE TABLE IF NOT EXISTS bike_recommendation_runs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    max_bike_id BIGINT NOT NULL,
+    k INT NOT NULL,
+    threshold DOUBLE NOT NULL
 );
@@ -4,6 +4,9 @@ import time
 from db import get_connection
 
 DDL = """
+DROP TABLE IF EXISTS bike_recommendation_runs CASCADE;
+DROP TABLE IF EXISTS bike_recommendations CASCADE;
+DROP TABLE IF EXISTS conversations CASCADE;
 DROP TABLE IF EXISTS messages CASCADE;
 DROP TABLE IF EXISTS bikes CASCADE;
 DROP TABLE IF EXISTS users CASCADE;
@@ -29,13 +32,27 @@ CREATE TABLE bikes (
   description    TEXT,
   owner_id       BIGINT,
   created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  updated_at     TIMESTAMPTZ NOT NULL DEFAULT NOW(),
   location_name  TEXT,
   latitude       NUMERIC,
   longitude      NUMERIC,
+  search_tsv     tsvector GENERATED ALWAYS AS (
+    to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(model, '') || ' ' || coalesce(description, ''))
+  ) STORED,
   FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE SET NULL
 );
-CREATE INDEX idx_bikes_created_at ON bikes(created_at);
-CREATE INDEX idx_bikes_sale_type ON bikes(sale_type);
+CREATE INDEX idx_bikes_created_at_id ON bikes(created_at DESC, id DESC);
+CREATE INDEX idx_bikes_owner_created_at ON bikes(owner_id, created_at DESC);
+CREATE INDEX idx_bikes_sale_type_created_at ON bikes(sale_type, created_at DESC, id DESC);
+CREATE INDEX idx_bikes_sale_price ON bikes(sale_price) WHERE sale_price IS NOT NULL;
+CREATE INDEX idx_bikes_rental_price ON bikes(rental_price) WHERE rental_price IS NOT NULL;
+CREATE INDEX idx_bikes_lat_lon ON bikes(latitude, longitude) WHERE latitude IS NOT NULL;
+CREATE INDEX idx_bikes_search_tsv ON bikes USING gin (search_tsv);
+-- /api/bikes/suggest prefix matches when pg_trgm is missing: lower(title) LIKE 'q%'
+CREATE INDEX idx_bikes_title_lower_prefix ON bikes(lower(title) text_pattern_ops);
+CREATE INDEX idx_bikes_model_lower_prefix ON bikes(lower(model) text_pattern_ops);
+-- trigram indexes for /api/bikes/suggest need pg_trgm, which not every role may
+-- create: database/migrations.py adds them when the extension is available
 
 -- Messages
 CREATE TABLE messages (
@@ -47,6 +64,37 @@ CREATE TABLE messages (
   created_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 CREATE INDEX idx_messages_bike_created_at ON messages(bike_id, created_at);
+CREATE INDEX idx_messages_sender_created_at ON messages(sender_id, created_at);
+CREATE INDEX idx_messages_receiver_created_at ON messages(receiver_id, created_at);
+
+-- Conversation list: newest message per (bike, user pair), upserted by send_message()
+CREATE TABLE conversations (
+  bike_id         BIGINT NOT NULL REFERENCES bikes(id) ON DELETE CASCADE,
+  user_low        BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  user_high       BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  last_message_id BIGINT NOT NULL,
+  last_message    TEXT NOT NULL,
+  last_message_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (bike_id, user_low, user_high)
+);
+CREATE INDEX idx_conversations_user_low ON conversations(user_low, last_message_at DESC);
+CREATE INDEX idx_conversations_user_high ON conversations(user_high, last_message_at DESC);
+
+-- Precomputed neighbours (database/build_recommendations.py)
+CREATE TABLE bike_recommendations (
+  bike_id        BIGINT NOT NULL,
+  rec_rank       SMALLINT NOT NULL,
+  recommended_id BIGINT NOT NULL,
+  similarity     DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (bike_id, rec_rank)
+);
+CREATE TABLE bike_recommendation_runs (
+  id          BIGSERIAL PRIMARY KEY,
+  finished_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  max_bike_id BIGINT NOT NULL,
+  k           INT NOT NULL,
+  threshold   DOUBLE PRECISION NOT NULL
+);
 """
 
 SEED = """
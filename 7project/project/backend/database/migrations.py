@@ -3,10 +3,96 @@ try:
 except ImportError:  # pragma: no cover
     MySQLError = Exception  # type: ignore
 
-from db import get_connection
+import logging
+
+from db import get_connection, is_postgres
+
+# 'simple' config (no stemming) keeps brand/model names intact; search.py queries with the same config
+SEARCH_TSV_EXPR = (
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(model, '') || ' ' || coalesce(description, ''))"
+)
+
 
 def _is_postgres_connection(conn) -> bool:
-    return conn.__class__.__module__.startswith("psycopg2")
+    return is_postgres(conn)
+
+
+def _pg_optional(cur, sql):
+    """Run an optional PostgreSQL statement (extension, generated column...).
+
+    A savepoint keeps a failure (old server, missing privilege) from aborting
+    the rest of the migration transaction. Returns True on success.
+    """
+    cur.execute("SAVEPOINT optional_ddl;")
+    try:
+        cur.execute(sql)
+    except Exception as exc:
+        cur.execute("ROLLBACK TO SAVEPOINT optional_ddl;")
+        logging.warning("Optional migration skipped (%s): %s", exc, sql.split("(")[0].strip())
+        return False
+    cur.execute("RELEASE SAVEPOINT optional_ddl;")
+    return True
+
+
+def _mysql_ensure_index(cur, table, name, columns, kind="INDEX"):
+    """CREATE INDEX on MySQL only when it is missing (no IF NOT EXISTS there)."""
+    cur.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (name,))
+    if cur.fetchall():
+        return
+    try:
+        cur.execute(f"CREATE {kind} {name} ON {table} ({columns});")
+    except Exception as exc:  # pragma: no cover
+        if getattr(exc, "errno", None) != 1061:
+            raise
+
+
+# newest message per (bike, user pair), to fill `conversations` from history:
+# DISTINCT ON on PostgreSQL, ROW_NUMBER() on MySQL 8. Like send_message(), the
+# highest message id is the newest.
+_PG_LATEST_MESSAGES = """
+    SELECT DISTINCT ON (bike_id, LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id))
+           bike_id, LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), id, content, created_at
+    FROM messages
+    ORDER BY bike_id, LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), id DESC
+"""
+_MYSQL_LATEST_MESSAGES = """
+    SELECT bike_id, user_low, user_high, id, content, created_at
+    FROM (SELECT bike_id, LEAST(sender_id, receiver_id) AS user_low, GREATEST(sender_id, receiver_id) AS user_high,
+                 id, content, created_at,
+                 ROW_NUMBER() OVER (PARTITION BY bike_id, LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id)
+                                    ORDER BY id DESC) AS rn
+          FROM messages) latest
+    WHERE rn = 1
+"""
+
+
+def _backfill_conversations(cur, pg):
+    """
+    Bring `conversations` up to date with `messages`, on every migration run:
+    messages written by code that predates the table (e.g. an old replica
+    during a rolling deploy) are picked up. Idempotent, and a row only ever
+    moves to a newer message, the same rule as routes/data._touch_conversation.
+    """
+    columns = "(bike_id, user_low, user_high, last_message_id, last_message, last_message_at)"
+    if pg:
+        cur.execute(
+            f"""INSERT INTO conversations {columns} {_PG_LATEST_MESSAGES}
+                ON CONFLICT (bike_id, user_low, user_high) DO UPDATE SET
+                  last_message_id = EXCLUDED.last_message_id,
+                  last_message = EXCLUDED.last_message,
+                  last_message_at = EXCLUDED.last_message_at
+                WHERE conversations.last_message_id < EXCLUDED.last_message_id"""
+        )
+    else:
+        # MySQL assigns left to right: last_message_id has to go last
+        cur.execute(
+            f"""INSERT INTO conversations {columns} {_MYSQL_LATEST_MESSAGES}
+                ON DUPLICATE KEY UPDATE
+                  last_message = IF(VALUES(last_message_id) > last_message_id, VALUES(last_message), last_message),
+                  last_message_at = IF(VALUES(last_message_id) > last_message_id, VALUES(last_message_at), last_message_at),
+                  last_message_id = GREATEST(last_message_id, VALUES(last_message_id))"""
+        )
+
 
 def ensure_schema():
     conn = get_connection()
@@ -18,6 +104,77 @@ def ensure_schema():
             cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS location_name TEXT;")
             cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;")
             cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;")
+            # listing ETags without Redis: MAX(updated_at) moves when a bike is edited
+            cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();")
+            # keyset pagination on GET /api/bikes: ORDER BY created_at DESC, id DESC
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_created_at_id ON bikes (created_at DESC, id DESC);")
+            # profile listings (owner= filter)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_owner_created_at ON bikes (owner_id, created_at DESC);")
+            # listing filters: type=venta/alquiler (sale_type IN (..., 'ambos')) in listing order
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_sale_type_created_at ON bikes (sale_type, created_at DESC, id DESC);")
+            # price range filters always imply a non-NULL price, so partial indexes skip the NULL half
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_sale_price ON bikes (sale_price) WHERE sale_price IS NOT NULL;")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_rental_price ON bikes (rental_price) WHERE rental_price IS NOT NULL;")
+            # near= radius search: bounding-box range scan (bikes without a location are left out)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_lat_lon ON bikes (latitude, longitude) WHERE latitude IS NOT NULL;")
+            # left-prefixes of the composites above, only cost writes now
+            cur.execute("DROP INDEX IF EXISTS idx_bikes_sale_type;")
+            cur.execute("DROP INDEX IF EXISTS idx_bikes_created_at;")
+            # full-text search over title/model/description (generated columns need PG 12+)
+            if _pg_optional(cur, f"ALTER TABLE bikes ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS ({SEARCH_TSV_EXPR}) STORED;"):
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_search_tsv ON bikes USING gin (search_tsv);")
+            # typeahead (/api/bikes/suggest): trigram GiST supports LIKE '%q%' and <-> ordering
+            if _pg_optional(cur, "CREATE EXTENSION IF NOT EXISTS pg_trgm;"):
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_title_trgm ON bikes USING gist (lower(title) gist_trgm_ops);")
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_model_trgm ON bikes USING gist (lower(model) gist_trgm_ops);")
+                # search= owner matches: users.name LIKE '%x%'
+                cur.execute("CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gin (name gin_trgm_ops);")
+            # typeahead without pg_trgm: lower(title) LIKE 'q%' (text_pattern_ops works under any collation)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_title_lower_prefix ON bikes (lower(title) text_pattern_ops);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_bikes_model_lower_prefix ON bikes (lower(model) text_pattern_ops);")
+            # per-participant message lookups (sender_id = %s OR receiver_id = %s -> BitmapOr)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender_created_at ON messages (sender_id, created_at);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_receiver_created_at ON messages (receiver_id, created_at);")
+            # offline neighbours written by database/build_recommendations.py
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bike_recommendations (
+                  bike_id        BIGINT NOT NULL,
+                  rec_rank       SMALLINT NOT NULL,
+                  recommended_id BIGINT NOT NULL,
+                  similarity     DOUBLE PRECISION NOT NULL,
+                  PRIMARY KEY (bike_id, rec_rank)
+                );
+                """
+            )
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bike_recommendation_runs (
+                  id          BIGSERIAL PRIMARY KEY,
+                  finished_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                  max_bike_id BIGINT NOT NULL,
+                  k           INT NOT NULL,
+                  threshold   DOUBLE PRECISION NOT NULL
+                );
+                """
+            )
+            # one row per (bike, user pair), kept current by send_message()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                  bike_id         BIGINT NOT NULL REFERENCES bikes(id) ON DELETE CASCADE,
+                  user_low        BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                  user_high       BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                  last_message_id BIGINT NOT NULL,
+                  last_message    TEXT NOT NULL,
+                  last_message_at TIMESTAMPTZ NOT NULL,
+                  PRIMARY KEY (bike_id, user_low, user_high)
+                );
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user_low ON conversations (user_low, last_message_at DESC);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user_high ON conversations (user_high, last_message_at DESC);")
+            _backfill_conversations(cur, pg=True)
         else:
             cur.execute(
                 """
@@ -70,76 +227,78 @@ def ensure_schema():
                     except Exception as exc:  # pragma: no cover
                         if getattr(exc, "errno", None) != 1060:
                             raise
-    finally:
-        conn.commit()
-        conn.close()
-
-def _is_postgres_connection(conn) -> bool:
-    return conn.__class__.__module__.startswith("psycopg2")
 
-
-def ensure_schema():
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        if _is_postgres_connection(conn):
-            cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_hash TEXT;")
-            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_name_key ON users(name);")
-            cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS location_name TEXT;")
-            cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;")
-            cur.execute("ALTER TABLE bikes ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;")
-        else:
             cur.execute(
                 """
                 SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND COLUMN_NAME = 'password_hash'
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bikes' AND COLUMN_NAME = 'updated_at'
                 """
             )
             result = cur.fetchone()
-            column_missing = not result or result[0] == 0
-            if column_missing:
+            if not result or result[0] == 0:
                 try:
-                    cur.execute("ALTER TABLE users ADD COLUMN password_hash TEXT;")
+                    # listing ETags without Redis: MAX(updated_at) moves when a bike is edited
+                    cur.execute("ALTER TABLE bikes ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP;")
                 except Exception as exc:  # pragma: no cover
                     if getattr(exc, "errno", None) != 1060:
                         raise
 
-            cur.execute("SHOW INDEX FROM users WHERE Key_name = 'users_name_key'")
-            if not cur.fetchone():
-                try:
-                    cur.execute("CREATE UNIQUE INDEX users_name_key ON users(name);")
-                except Exception as exc:  # pragma: no cover
-                    if getattr(exc, "errno", None) not in (1061, 1840):
-                        raise
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_created_at_id", "created_at, id")
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_owner_created_at", "owner_id, created_at")
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_sale_type_created_at", "sale_type, created_at, id")
+            # no partial indexes in MySQL; NULL prices just sit at the start of the range
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_sale_price", "sale_price")
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_rental_price", "rental_price")
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_lat_lon", "latitude, longitude")
+            _mysql_ensure_index(cur, "bikes", "ft_bikes_search", "title, model, description", kind="FULLTEXT INDEX")
+            # typeahead prefix lookups (title LIKE 'q%')
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_title_prefix", "title(64)")
+            _mysql_ensure_index(cur, "bikes", "idx_bikes_model_prefix", "model(64)")
+            # per-participant message lookups (index_merge union for sender OR receiver)
+            _mysql_ensure_index(cur, "messages", "idx_messages_sender_created_at", "sender_id, created_at")
+            _mysql_ensure_index(cur, "messages", "idx_messages_receiver_created_at", "receiver_id, created_at")
 
             cur.execute(
                 """
-                SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bikes' AND COLUMN_NAME = 'location_name'
+                CREATE TABLE IF NOT EXISTS bike_recommendations (
+                  bike_id        BIGINT NOT NULL,
+                  rec_rank       SMALLINT NOT NULL,
+                  recommended_id BIGINT NOT NULL,
+                  similarity     DOUBLE NOT NULL,
+                  PRIMARY KEY (bike_id, rec_rank)
+                )
                 """
             )
-            result = cur.fetchone()
-            if not result or result[0] == 0:
-                try:
-                    cur.execute("ALTER TABLE bikes ADD COLUMN location_name TEXT;")
-                except Exception as exc:  # pragma: no cover
-                    if getattr(exc, "errno", None) != 1060:
-                        raise
-
-            for col in ("latitude", "longitude"):
-                cur.execute(
-                    f"""
-                    SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bikes' AND COLUMN_NAME = '{col}'
-                    """
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bike_recommendation_runs (
+                  id          BIGINT AUTO_INCREMENT PRIMARY KEY,
+                  finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  max_bike_id BIGINT NOT NULL,
+                  k           INT NOT NULL,
+                  threshold   DOUBLE NOT NULL
                 )
-                result = cur.fetchone()
-                if not result or result[0] == 0:
-                    try:
-                        cur.execute(f"ALTER TABLE bikes ADD COLUMN {col} DOUBLE;")
-                    except Exception as exc:  # pragma: no cover
-                        if getattr(exc, "errno", None) != 1060:
-                            raise
+                """
+            )
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                  bike_id         INT NOT NULL,
+                  user_low        INT NOT NULL,
+                  user_high       INT NOT NULL,
+                  last_message_id INT NOT NULL,
+                  last_message    TEXT NOT NULL,
+                  last_message_at TIMESTAMP NOT NULL,
+                  PRIMARY KEY (bike_id, user_low, user_high),
+                  INDEX idx_conversations_user_low (user_low, last_message_at),
+                  INDEX idx_conversations_user_high (user_high, last_message_at),
+                  FOREIGN KEY (bike_id) REFERENCES bikes(id) ON DELETE CASCADE,
+                  FOREIGN KEY (user_low) REFERENCES users(id) ON DELETE CASCADE,
+                  FOREIGN KEY (user_high) REFERENCES users(id) ON DELETE CASCADE
+                )
+                """
+            )
+            _backfill_conversations(cur, pg=False)
     finally:
         conn.commit()
         conn.close()
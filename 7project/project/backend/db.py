@@ -1,4 +1,10 @@
 import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from flask import g
+
 import mysql.connector
 import psycopg2
 
@@ -17,8 +23,253 @@ def _connect_postgres(db_url: str):
     return psycopg2.connect(db_url)
 
 
-def get_connection():
+def _connect():
     db_url = os.getenv("DB_URL")
     if db_url:
         return _connect_postgres(db_url)
     return _connect_mysql()
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+def _ping(raw) -> bool:
+    """Cheap liveness check for an idle connection before handing it out."""
+    try:
+        if getattr(raw, "closed", 0):
+            return False
+        cur = raw.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        raw.rollback()
+        return True
+    except Exception:
+        return False
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the checkout timeout."""
+
+
+class PooledConnection:
+    """Thin proxy around a raw DB-API connection.
+
+    close() hands the connection back to its pool instead of tearing down the
+    socket, so existing `conn.close()` call sites keep working unchanged.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self.raw = raw
+
+    def close(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.release(self.raw)
+
+    def discard(self):
+        """Drop the underlying connection (e.g. after a fatal error)."""
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.release(self.raw, discard=True)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __del__(self):
+        # Safety net for handlers that forget to close on an early return
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Small thread-safe LIFO pool, one per worker process."""
+
+    def __init__(self, connect, max_size=10, timeout=5.0, pre_ping=True):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.pid = os.getpid()
+        self._idle = []
+        self._lock = threading.RLock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def acquire(self) -> PooledConnection:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no database connection available within {self.timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    raw = self._idle.pop() if self._idle else None
+                if raw is None:
+                    raw = self._connect()
+                    break
+                if not self.pre_ping or _ping(raw):
+                    break
+                _close_quietly(raw)
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, raw)
+
+    def release(self, raw, discard=False):
+        try:
+            if os.getpid() != self.pid:
+                # Never touch (or close) sockets inherited across a fork
+                return
+            if not discard:
+                try:
+                    # end any implicit transaction so idle connections hold no locks
+                    raw.rollback()
+                except Exception:
+                    discard = True
+            if discard:
+                _close_quietly(raw)
+            else:
+                with self._lock:
+                    self._idle.append(raw)
+        finally:
+            self._slots.release()
+
+    def close_idle(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw in idle:
+            _close_quietly(raw)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Connections inherited from a parent process are kept referenced (never
+# closed or garbage collected) so the child cannot terminate the parent's sessions.
+_inherited_pools = []
+
+
+def _get_pool():
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            if _pool is not None:
+                _inherited_pools.append(_pool)
+            _pool = ConnectionPool(
+                _connect,
+                max_size=_env_int("DB_POOL_MAX_SIZE", 10),
+                timeout=_env_float("DB_POOL_TIMEOUT", 5.0),
+                pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+            )
+        return _pool
+
+
+def _reset_pool_after_fork():
+    global _pool, _pool_lock
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def get_connection():
+    """Check out a connection from the per-worker pool.
+
+    Call close() on the result to return it. DB_POOL_MAX_SIZE=0 disables
+    pooling and opens a dedicated connection instead.
+    """
+    if _env_int("DB_POOL_MAX_SIZE", 10) <= 0:
+        return _connect()
+    return _get_pool().acquire()
+
+
+@contextmanager
+def connection():
+    """Context manager form of get_connection(): always returns the connection."""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def is_postgres(conn) -> bool:
+    raw = conn.raw if isinstance(conn, PooledConnection) else conn
+    return raw.__class__.__module__.startswith("psycopg2")
+
+
+STREAM_BATCH_SIZE = 500
+
+
+def server_side_cursor(conn):
+    """Cursor that leaves the result set on the database server.
+
+    psycopg2 gets a named cursor, MySQL an unbuffered one; rows are then pulled
+    with iter_rows() in fetchmany batches instead of one big fetchall().
+    """
+    if is_postgres(conn):
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cur.itersize = STREAM_BATCH_SIZE
+        return cur
+    raw = conn.raw if isinstance(conn, PooledConnection) else conn
+    if raw.__class__.__module__.startswith("mysql"):
+        return conn.cursor(buffered=False)
+    return conn.cursor()
+
+
+def iter_rows(cursor, batch_size=STREAM_BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def get_db():
+    """Connection bound to the current app context: at most one per request.
+
+    Released by close_db() when the app context tears down.
+    """
+    conn = g.get("db_conn")
+    if conn is None:
+        conn = g.db_conn = get_connection()
+    return conn
+
+
+def close_db(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is None:
+        return
+    if exc is not None:
+        rollback = getattr(conn, "rollback", None)
+        if rollback is not None:
+            try:
+                rollback()
+            except Exception:
+                pass
+    conn.close()
@@ -0,0 +1,155 @@
+"""Location helpers for the bike listing and the map.
+
+Radius search (near=lat,lon&radius_km=) runs in two steps: a latitude/longitude
+bounding box that the (latitude, longitude) index can range-scan, then the
+exact haversine distance on what is left. Map clustering groups bikes into a
+zoom-dependent grid of cells.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_RADIUS_KM = 10.0
+MAX_RADIUS_KM = 500.0
+
+
+def parse_near(raw, radius=None):
+    """
+    Parse `near=lat,lon` and `radius_km`.
+    Returns (lat, lon, radius_km). Raises ValueError on malformed input.
+    """
+    try:
+        lat, lon = (float(part) for part in raw.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('near must be "lat,lon"')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('near is out of range')
+    if radius in (None, ''):
+        radius_km = DEFAULT_RADIUS_KM
+    else:
+        try:
+            radius_km = float(radius)
+        except ValueError:
+            raise ValueError('radius_km must be a number')
+        if not radius_km > 0:
+            raise ValueError('radius_km must be positive')
+    return lat, lon, min(radius_km, MAX_RADIUS_KM)
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Smallest lat/lon box containing the circle.
+    Returns (min_lat, max_lat, lon_ranges); lon_ranges is a list of
+    (min_lon, max_lon) pairs (two when the box crosses the antimeridian,
+    none when it covers a pole and every longitude qualifies).
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = lat - math.degrees(angular)
+    max_lat = lat + math.degrees(angular)
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), []
+    dlon = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(lat))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180.0), (-180.0, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def distance_sql(lat, lon, lat_col='b.latitude', lon_col='b.longitude'):
+    """
+    Haversine distance in km from (lat, lon) to the row, as SQL valid on both
+    PostgreSQL and MySQL. LEAST() guards ASIN against rounding just above 1.
+    Returns (sql, params).
+    """
+    sql = (
+        f"(2 * {EARTH_RADIUS_KM} * ASIN(LEAST(1, SQRT("
+        f"POWER(SIN(RADIANS({lat_col} - %s) / 2), 2) + "
+        f"COS(RADIANS(%s)) * COS(RADIANS({lat_col})) * POWER(SIN(RADIANS({lon_col} - %s) / 2), 2)"
+        f"))))"
+    )
+    return sql, [lat, lat, lon]
+
+
+def radius_clause(lat, lon, radius_km, lat_col='b.latitude', lon_col='b.longitude'):
+    """
+    WHERE fragments for "within radius_km of (lat, lon)": the indexable box
+    first, then the exact distance check.
+    Returns (where, params) lists.
+    """
+    min_lat, max_lat, lon_ranges = bounding_box(lat, lon, radius_km)
+    where = [f"{lat_col} BETWEEN %s AND %s"]
+    params = [min_lat, max_lat]
+    if lon_ranges:
+        where.append("(" + " OR ".join(f"{lon_col} BETWEEN %s AND %s" for _ in lon_ranges) + ")")
+        for pair in lon_ranges:
+            params.extend(pair)
+    dist, dist_params = distance_sql(lat, lon, lat_col, lon_col)
+    where.append(f"{dist} <= %s")
+    params.extend(dist_params + [radius_km])
+    return where, params
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Same distance as distance_sql(), in Python."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+# Map clustering: a zoom-z web map tile spans 360 / 2**z degrees; split each
+# tile into CLUSTER_CELLS_PER_TILE x CLUSTER_CELLS_PER_TILE grid cells.
+CLUSTER_CELLS_PER_TILE = 4
+MAX_ZOOM = 20
+MAX_CLUSTER_CELLS = 16384
+
+
+def parse_bbox(raw):
+    """
+    Parse `bbox=west,south,east,north` (Leaflet's toBBoxString order).
+    west > east means the box crosses the antimeridian.
+    Raises ValueError on malformed input.
+    """
+    try:
+        west, south, east, north = (float(part) for part in raw.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError('bbox must be "west,south,east,north"')
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south < north <= 90):
+        raise ValueError('bbox is out of range')
+    return west, south, east, north
+
+
+def cell_size(zoom):
+    """Grid cell edge in degrees for a map zoom level."""
+    return 360.0 / (2 ** zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def snap_bbox(bbox, cell):
+    """
+    Grow bbox outwards to whole grid cells, so panning by less than a cell
+    maps to the same (cacheable) query. Raises ValueError when the box would
+    hold more than MAX_CLUSTER_CELLS cells.
+    """
+    west, south, east, north = bbox
+    south = max(-90.0, math.floor(south / cell) * cell)
+    north = min(90.0, math.ceil(north / cell) * cell)
+    west = max(-180.0, math.floor(west / cell) * cell)
+    east = min(180.0, math.ceil(east / cell) * cell)
+    width = east - west if west <= east else (180 - west) + (east + 180)
+    if round(width / cell) * round((north - south) / cell) > MAX_CLUSTER_CELLS:
+        raise ValueError('bbox is too large for this zoom level')
+    return west, south, east, north
+
+
+def bbox_clause(bbox, lat_col='b.latitude', lon_col='b.longitude'):
+    """WHERE fragments for "inside bbox". Returns (where, params) lists."""
+    west, south, east, north = bbox
+    where = [f"{lat_col} BETWEEN %s AND %s"]
+    params = [south, north]
+    if west <= east:
+        where.append(f"{lon_col} BETWEEN %s AND %s")
+    else:
+        where.append(f"({lon_col} >= %s OR {lon_col} <= %s)")
+    params.extend([west, east])
+    return where, params
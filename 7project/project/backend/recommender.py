@@ -0,0 +1,980 @@
+"""Bike similarity for /api/recommendations.
+
+Each worker keeps every bike's feature vector in one row-normalised NumPy
+matrix plus an id -> row index, so a recommendation is a single dot product
+(cosine similarity) instead of re-reading and re-encoding the catalogue.
+
+The matrix is built on first use. The worker that handles a bike write
+patches its own copy in place (bike_changed / bike_removed). Every write
+also bumps the catalogue version in Redis and logs the bike id with it
+(cache.catalog_changes), so other workers replay just those ids through
+upsert / remove. They rebuild only when the log has a gap, and without
+Redis after RECOMMENDER_MAX_AGE seconds.
+
+When database/build_recommendations.py has run, bikes it covered are
+served from the bike_recommendations table instead, and only newer bikes
+(or non-default k / threshold) are computed live.
+
+Top-k selection uses argpartition. On large catalogues, candidates come
+from a KD-tree over the unit rows instead of a full scan: for unit vectors,
+Euclidean nearest means highest cosine. RECOMMENDER_INDEX=auto|brute|kdtree
+controls this; auto switches to the tree at RECOMMENDER_TREE_MIN_ROWS.
+
+A second, text channel compares title/model/description as TF-IDF vectors
+in a SciPy sparse matrix (see TextIndex). Between two bikes that both have
+text, similarity is (1 - w) * numeric + w * text with
+w = RECOMMENDER_TEXT_WEIGHT; otherwise it is the numeric score alone. The
+text matrix is also kept term-major, so a query only walks the posting
+lists of its own words; with the tree, those bikes join the numeric
+neighbours as candidates and only that set is scored.
+
+Only NumPy is required; without SciPy there is no tree and no text channel.
+routes/data.py imports this module on the first recommendation request, and
+SciPy is imported when the first index is built, so neither weighs on worker
+startup.
+"""
+from collections import Counter
+from functools import lru_cache
+import math
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+import cache
+from db import iter_rows, server_side_cursor
+import shared_arrays
+
+SALE_TYPE_CODES = {'venta': 0, 'alquiler': 1, 'ambos': 2}
+CONDITION_CODES = {'Poor': 0, 'Fair': 1, 'Good': 2, 'Very Good': 3, 'Excellent': 4}
+DEFAULT_CONDITION = 2  # Good
+
+# columns encode() and text_of() expect, in order
+FEATURE_COLUMNS = "id, sale_price, rental_price, sale_type, bike_condition, latitude, longitude, title, model, description"
+FEATURE_DIM = 5
+DEFAULT_TEXT_WEIGHT = 0.3
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+DEFAULT_K = 3
+MAX_K = 50
+DEFAULT_THRESHOLD = 0.5
+# similarity entries per matrix product in batch mode (~32 MB of float64)
+BATCH_CELLS = 4_000_000
+# rows changed since the KD-tree was built are scored by brute force; past
+# this share of the catalogue the tree is rebuilt instead
+TREE_STALE_FRACTION = 0.01
+# a tree query that would have to score more than this share of the catalogue
+# (common words under the text channel) scans it instead
+TREE_SCAN_FRACTION = 0.125
+# first tree read with the text channel on: a common word (a brand) can only be
+# left unread once the numeric bound has dropped, which takes a few thousand rows
+TREE_TEXT_NEIGHBOURS = 2048
+# free rows written into a shared snapshot, so creates fit in place until the next rebuild
+SNAPSHOT_SPARE_ROWS = 1024
+# how long the newest changes may stay unlogged (writer between INCR and SET) before rebuilding
+CHANGE_LOG_WAIT = 5.0
+
+
+def _float_or_zero(val):
+    try:
+        return float(val) if val is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def encode(row):
+    """Feature vector for a (FEATURE_COLUMNS) row: price, type, condition, position."""
+    _, sale_price, rental_price, sale_type, condition, lat, lon = row[:7]
+    price = _float_or_zero(sale_price or rental_price or 0)
+    return [
+        price / 1000.0,
+        SALE_TYPE_CODES.get(sale_type, 0),
+        CONDITION_CODES.get(condition, DEFAULT_CONDITION),
+        _float_or_zero(lat) / 90.0,
+        _float_or_zero(lon) / 180.0,
+    ]
+
+
+def text_of(row):
+    """Lower-cased words of a (FEATURE_COLUMNS) row's title, model and description."""
+    words = []
+    for part in row[7:]:
+        if part:
+            words.extend(w for w in _WORD_RE.findall(str(part).lower()) if len(w) > 1)
+    return words
+
+
+def _normalise(vectors):
+    """Scale rows to unit length; all-zero rows stay zero (cosine 0 to everything)."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def default_k():
+    return max(1, min(_env_int('RECOMMENDER_K', DEFAULT_K), MAX_K))
+
+
+def default_threshold():
+    return _env_float('RECOMMENDER_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+def text_weight():
+    return max(0.0, min(_env_float('RECOMMENDER_TEXT_WEIGHT', DEFAULT_TEXT_WEIGHT), 1.0))
+
+
+@lru_cache(maxsize=None)
+def _kdtree_class():
+    """scipy's cKDTree, or None without SciPy (brute force only)."""
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    return cKDTree
+
+
+@lru_cache(maxsize=None)
+def _sparse():
+    """scipy.sparse, or None without SciPy (numeric features only)."""
+    try:
+        from scipy import sparse
+    except ImportError:
+        return None
+    return sparse
+
+
+def _top_k(rows, scores, k, threshold):
+    """rows/scores above threshold, best k only, most similar first."""
+    keep = scores > threshold
+    rows, scores = rows[keep], scores[keep]
+    if len(rows) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[part], scores[part]
+    order = np.argsort(-scores, kind='stable')
+    return rows[order], scores[order]
+
+
+class TextIndex:
+    """
+    TF-IDF rows (sublinear tf, smoothed idf, unit length) in a CSR matrix whose
+    rows line up with FeatureIndex rows. IDF is fitted once, when the index is
+    built; later writes reuse it (unseen words get the idf of a one-off word)
+    and go to a small overlay that is folded into the matrix once it grows,
+    so scoring is always a sparse product and never a refit.
+
+    Scoring goes through `postings`, the same matrix term-major (one row per
+    word listing the bikes that use it), so its cost follows the posting
+    lists of the query's words rather than the size of the catalogue; `hits`
+    can leave out the longest lists when their words cannot add much.
+    """
+
+    def __init__(self, sparse):
+        self.sparse = sparse
+        self.vocab = {}
+        self.idf = []
+        self.docs = 0  # documents the idf was fitted on
+        self.base = sparse.csr_matrix((0, 0))
+        self._postings = None  # base transposed to CSR, built on first use
+        self._term_max = None  # highest weight in each posting list
+        self._textless = None  # base rows without any text, found on first use
+        self.overlay = {}  # row -> (columns, weights), overrides base
+
+    @classmethod
+    def build(cls, sparse, docs):
+        index = cls(sparse)
+        counts = [Counter(words) for words in docs]
+        df = Counter()
+        for c in counts:
+            df.update(c.keys())
+        index.docs = len(counts)
+        index.vocab = {word: col for col, word in enumerate(df)}
+        index.idf = [math.log((1 + index.docs) / (1 + n)) + 1 for n in df.values()]
+        index.base = index._matrix([index._vector(c) for c in counts], len(counts))
+        return index
+
+    @property
+    def postings(self):
+        """base as terms x rows CSR: row t holds the bikes using word t."""
+        if self._postings is None:
+            self._postings = self.base.T.tocsr()
+        return self._postings
+
+    @property
+    def term_max(self):
+        if self._term_max is None:
+            postings = self.postings
+            self._term_max = np.zeros(postings.shape[0])
+            used = np.flatnonzero(np.diff(postings.indptr))
+            if len(used):
+                self._term_max[used] = np.maximum.reduceat(postings.data, postings.indptr[used])
+        return self._term_max
+
+    def _vector(self, counts):
+        for word in counts:
+            if word not in self.vocab:
+                self.vocab[word] = len(self.idf)
+                self.idf.append(math.log((1 + self.docs) / 2) + 1)
+        cols = np.array([self.vocab[w] for w in counts], dtype=np.int32)
+        weights = np.array([(1 + math.log(n)) * self.idf[self.vocab[w]] for w, n in counts.items()])
+        if len(weights):
+            weights /= np.linalg.norm(weights)
+        return cols, weights
+
+    def _matrix(self, vectors, rows, cols=None, at=None):
+        """
+        CSR matrix with vectors[j] in row at[j] (ascending; default j).
+        Columns from `cols` on are dropped.
+        """
+        cols = len(self.idf) if cols is None else cols
+        if cols < len(self.idf):
+            vectors = [(c[c < cols], w[c < cols]) for c, w in vectors]
+        lengths = np.zeros(rows, dtype=np.int64)
+        lengths[np.arange(len(vectors)) if at is None else at] = [len(c) for c, _ in vectors]
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.concatenate([c for c, _ in vectors] + [np.zeros(0, dtype=np.int32)])
+        data = np.concatenate([w for _, w in vectors] + [np.zeros(0)])
+        return self.sparse.csr_matrix((data, indices, indptr), shape=(rows, cols))
+
+    def row(self, i):
+        if i in self.overlay:
+            return self.overlay[i]
+        if i < self.base.shape[0]:
+            start, end = self.base.indptr[i], self.base.indptr[i + 1]
+            return self.base.indices[start:end], self.base.data[start:end]
+        return np.zeros(0, dtype=np.int32), np.zeros(0)
+
+    def set(self, i, words):
+        self.overlay[i] = self._vector(Counter(words))
+        self._maybe_fold()
+
+    def move(self, src, dst):
+        """Row src now lives at dst (FeatureIndex's swap-remove)."""
+        self.overlay[dst] = self.row(src)
+        self.overlay.pop(src, None)
+        self._maybe_fold()
+
+    def _maybe_fold(self):
+        if len(self.overlay) > max(64, TREE_STALE_FRACTION * self.base.shape[0]):
+            self.fold()
+
+    def fold(self):
+        """Merge the overlay into the CSR matrix (O(nnz))."""
+        if not self.overlay:
+            return
+        rows = max(self.base.shape[0], max(self.overlay) + 1)
+        keep = np.ones(self.base.shape[0])
+        keep[[i for i in self.overlay if i < len(keep)]] = 0
+        base = (self.sparse.diags(keep) @ self.base).tocsr()
+        base.resize((rows, len(self.idf)))
+        order = sorted(self.overlay)
+        patch = self._matrix([self.overlay[i] for i in order], rows, at=order)
+        self.base = (base + patch).tocsr()
+        self.base.eliminate_zeros()
+        self._postings = self._term_max = self._textless = None
+        self.overlay = {}
+
+    def _base_scores(self, vectors, size):
+        """Sparse (len(vectors), n) text cosines against base rows, via the postings of their words."""
+        n_base = min(self.base.shape[0], size)
+        if not n_base or not self.base.nnz:
+            return None
+        query = self._matrix(vectors, len(vectors), cols=self.base.shape[1])
+        hits = (query @ self.postings).tocsr()
+        if hits.shape[1] > n_base:
+            hits = hits[:, :n_base]
+        return hits
+
+    def has_text(self, i):
+        return len(self.row(i)[0]) > 0
+
+    def textless(self, size):
+        """Rows in [0, size) without any text (rare: every bike has a title)."""
+        if self._textless is None:
+            self._textless = np.flatnonzero(np.diff(self.base.indptr) == 0)
+        rows = self._textless[self._textless < size]
+        if self.overlay:
+            rows = rows[~np.isin(rows, list(self.overlay))]
+            rows = np.concatenate([rows, [i for i, (cols, _) in self.overlay.items() if i < size and not len(cols)]])
+        return rows.astype(np.int64)
+
+    def hits(self, i, size, budget, limit):
+        """
+        Rows in [0, size) that may share a word with row i, read from posting
+        lists. The longest lists are skipped as long as their words together
+        add at most `budget` to any row's cosine; overlay rows always count.
+        None when the lists left to read hold more than `limit` entries.
+        """
+        cols, weights = self.row(i)
+        known = cols < len(self.term_max)
+        cols, weights = cols[known], weights[known]
+        postings = self.postings
+        lengths = postings.indptr[cols + 1] - postings.indptr[cols]
+        order = np.argsort(-lengths, kind='stable')
+        skipped = np.cumsum(weights[order] * self.term_max[cols[order]]) <= budget
+        if lengths[order[~skipped]].sum() > limit:
+            return None
+        lists = [postings.indices[postings.indptr[c]:postings.indptr[c + 1]] for c in cols[order[~skipped]]]
+        rows = np.unique(np.concatenate(lists + [np.zeros(0, dtype=postings.indices.dtype)])).astype(np.int64)
+        rows = rows[rows < size]
+        if self.overlay:
+            patched = np.array([j for j in self.overlay if j < size], dtype=np.int64)
+            rows = np.union1d(rows[~np.isin(rows, patched)], patched)
+        return rows
+
+    def dots(self, i, rows):
+        """Text cosine between row i and each of rows."""
+        cols, weights = self.row(i)
+        out = np.zeros(len(rows))
+        if not len(cols) or not len(rows):
+            return out
+        query = np.zeros(len(self.idf))
+        query[cols] = weights
+        in_base = rows < self.base.shape[0]
+        if in_base.any():
+            base = self.base[rows[in_base]]
+            out[in_base] = base @ query[:base.shape[1]]
+        if self.overlay:
+            for at in np.flatnonzero(np.isin(rows, list(self.overlay))):
+                other, w = self.overlay[int(rows[at])]
+                out[at] = w @ query[other]
+        return out
+
+    def scores(self, targets, size):
+        """
+        Text cosine of each target row against rows [0, size), shape
+        (len(targets), size), plus which of those rows have any text.
+        """
+        vectors = [self.row(i) for i in targets]
+        out = np.zeros((len(targets), size))
+        n_base = min(self.base.shape[0], size)
+        hits = self._base_scores(vectors, size)
+        if hits is not None:
+            out[:, :hits.shape[1]] = hits.toarray()
+        has_text = np.zeros(size, dtype=bool)
+        has_text[:n_base] = np.diff(self.base.indptr)[:n_base] > 0
+        patched = [i for i in self.overlay if i < size]
+        if patched:
+            query = self._matrix(vectors, len(vectors))
+            patch = self._matrix([self.overlay[i] for i in patched], len(patched))
+            out[:, patched] = (patch @ query.T).toarray().T
+            has_text[patched] = [len(self.overlay[i][0]) > 0 for i in patched]
+        return out, has_text
+
+
+class _SortedRows:
+    """
+    id -> row for a shared snapshot, whose rows are sorted by id: a binary
+    search over the mapped ids, plus this worker's changes since (None = removed).
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.changed = {}
+
+    def get(self, bike_id, default=None):
+        if bike_id in self.changed:
+            i = self.changed[bike_id]
+            return default if i is None else i
+        i = int(np.searchsorted(self.ids, bike_id))
+        return i if i < len(self.ids) and self.ids[i] == bike_id else default
+
+    def __contains__(self, bike_id):
+        return self.get(bike_id) is not None
+
+    def __getitem__(self, bike_id):
+        i = self.get(bike_id)
+        if i is None:
+            raise KeyError(bike_id)
+        return i
+
+    def __setitem__(self, bike_id, i):
+        self.changed[bike_id] = i
+
+    def pop(self, bike_id, default=None):
+        i = self.get(bike_id)
+        if i is None:
+            return default
+        self.changed[bike_id] = None
+        return i
+
+
+class FeatureIndex:
+    """Unit-length feature rows with an id -> row index and amortised O(1) upserts."""
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.matrix = np.zeros((0, FEATURE_DIM))
+        self.size = 0
+        self.rows = {}
+        # KD-tree snapshot: tree position -> bike id, plus ids changed since
+        self._tree = None
+        self._tree_ids = self._tree_rows = None
+        self._stale = set()
+        self.text = None  # TextIndex, when SciPy is there and the text weight is on
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        sparse = _sparse() if text_weight() > 0 else None
+        ids, features, docs = [], [], []
+        for row in rows:
+            ids.append(row[0])
+            features.append(encode(row))
+            if sparse is not None:
+                docs.append(text_of(row))
+        index.ids = np.array(ids, dtype=np.int64)
+        index.matrix = _normalise(np.array(features, dtype=float).reshape(-1, FEATURE_DIM))
+        index.size = len(ids)
+        index.rows = {bike_id: i for i, bike_id in enumerate(ids)}
+        if sparse is not None:
+            index.text = TextIndex.build(sparse, docs)
+        return index
+
+    def snapshot(self):
+        """(arrays, meta) for shared_arrays.publish(): rows sorted by id, plus spare capacity."""
+        order = np.argsort(self.ids[:self.size], kind='stable')
+        capacity = self.size + max(SNAPSHOT_SPARE_ROWS, self.size // 100)
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size][order]
+        matrix = np.zeros((capacity, FEATURE_DIM))
+        matrix[:self.size] = self.matrix[:self.size][order]
+        arrays, meta = {'ids': ids, 'matrix': matrix}, {'size': self.size}
+        if self.text is not None:
+            self.text.fold()
+            base = self.text.base[:self.size][order]
+            base.resize((self.size, len(self.text.idf)))
+            postings = base.T.tocsr()
+            arrays.update(text_data=base.data, text_indices=base.indices, text_indptr=base.indptr,
+                          postings_data=postings.data, postings_indices=postings.indices,
+                          postings_indptr=postings.indptr, text_idf=np.array(self.text.idf))
+            meta.update(vocab=list(self.text.vocab), docs=self.text.docs)
+        return arrays, meta
+
+    @classmethod
+    def from_snapshot(cls, path, meta):
+        """
+        Map a published snapshot. Matrix and ids are copy-on-write, so this
+        worker's upserts only copy the pages they touch.
+        """
+        index = cls()
+        index.size = meta['size']
+        index.ids = shared_arrays.load(path, 'ids', 'c')
+        index.matrix = shared_arrays.load(path, 'matrix', 'c')
+        index.rows = _SortedRows(shared_arrays.load(path, 'ids')[:index.size])
+        sparse = _sparse()
+        if 'vocab' in meta and sparse is not None:
+            text = TextIndex(sparse)
+            text.vocab = {word: col for col, word in enumerate(meta['vocab'])}
+            text.idf = shared_arrays.load(path, 'text_idf').tolist()
+            text.docs = meta['docs']
+            text.base = sparse.csr_matrix(
+                (shared_arrays.load(path, 'text_data'), shared_arrays.load(path, 'text_indices'),
+                 shared_arrays.load(path, 'text_indptr')),
+                shape=(index.size, len(text.idf)),
+            )
+            text._postings = sparse.csr_matrix(
+                (shared_arrays.load(path, 'postings_data'), shared_arrays.load(path, 'postings_indices'),
+                 shared_arrays.load(path, 'postings_indptr')),
+                shape=(len(text.idf), index.size),
+            )
+            index.text = text
+        return index
+
+    def __contains__(self, bike_id):
+        return bike_id in self.rows
+
+    def __len__(self):
+        return self.size
+
+    def _touched(self, bike_id):
+        if self._tree is None:
+            return
+        self._stale.add(bike_id)
+        if len(self._stale) > max(64, TREE_STALE_FRACTION * len(self._tree_ids)):
+            self._tree = self._tree_ids = self._tree_rows = None  # rebuilt on the next query
+            self._stale = set()
+
+    def upsert(self, row):
+        bike_id = row[0]
+        self._touched(bike_id)
+        vector = _normalise(np.array(encode(row), dtype=float))
+        i = self.rows.get(bike_id)
+        if i is None:
+            if self.size == len(self.ids):
+                # grow by doubling so a run of creates stays amortised O(1)
+                capacity = max(16, 2 * self.size)
+                self.ids = np.resize(self.ids, capacity)
+                grown = np.zeros((capacity, FEATURE_DIM))
+                grown[:self.size] = self.matrix[:self.size]
+                self.matrix = grown
+            i = self.size
+            self.size += 1
+            self.rows[bike_id] = i
+            self.ids[i] = bike_id
+        self.matrix[i] = vector
+        if self.text is not None:
+            self.text.set(i, text_of(row))
+
+    def remove(self, bike_id):
+        i = self.rows.pop(bike_id, None)
+        if i is None:
+            return
+        self._touched(bike_id)
+        last = self.size - 1
+        if i != last:
+            # move the last row into the hole
+            moved = int(self.ids[last])
+            self._touched(moved)  # the tree has it at its old row
+            self.ids[i] = moved
+            self.matrix[i] = self.matrix[last]
+            self.rows[moved] = i
+            if self.text is not None:
+                self.text.move(last, i)
+        self.size = last
+
+    def _use_tree(self, threshold):
+        mode = os.getenv('RECOMMENDER_INDEX', 'auto').lower()
+        # the tree only finds neighbours, so it cannot serve "anything above a negative score"
+        if mode == 'brute' or threshold < 0:
+            return False
+        if mode != 'kdtree' and self.size < _env_int('RECOMMENDER_TREE_MIN_ROWS', 20000):
+            return False
+        return _kdtree_class() is not None
+
+    def _build_tree(self):
+        live = np.flatnonzero(np.any(self.matrix[:self.size] != 0, axis=1))
+        # all-zero rows score 0 against everything; leaving them out keeps them from posing as neighbours
+        self._tree = _kdtree_class()(self.matrix[live])
+        self._tree_ids = self.ids[live].copy()
+        self._tree_rows = live
+        self._stale = set()
+
+    def _text_on(self):
+        return self.text is not None and text_weight() > 0 and len(self.text.idf) > 0
+
+    def _text_scores(self, targets):
+        """TextIndex.scores() for the target rows, or None when the text channel is off."""
+        return self.text.scores(targets, self.size) if self._text_on() else None
+
+    @staticmethod
+    def _blend(numeric, text, both):
+        # text only counts between two bikes that both have some
+        w = text_weight()
+        return np.where(both, (1 - w) * numeric + w * text, numeric)
+
+    def similar(self, bike_id, k=DEFAULT_K, threshold=DEFAULT_THRESHOLD):
+        """Up to k (id, similarity) pairs above threshold, most similar first."""
+        return self.similar_many([bike_id], k=k, threshold=threshold)[bike_id]
+
+    def similar_many(self, bike_ids, k=DEFAULT_K, threshold=DEFAULT_THRESHOLD):
+        """similar() for several indexed bikes at once: {bike_id: [(id, similarity), ...]}."""
+        bike_ids = list(dict.fromkeys(bike_ids))
+        targets = np.array([self.rows[b] for b in bike_ids], dtype=np.int64)
+        if self._use_tree(threshold):
+            return self._similar_tree(bike_ids, targets, k, threshold)
+        return self._similar_scan(bike_ids, targets, k, threshold)
+
+    def _similar_scan(self, bike_ids, targets, k, threshold):
+        """similar_many() by scoring every row."""
+        out = {}
+        # one matrix product per chunk of targets, sized so the score block stays bounded
+        chunk = max(1, BATCH_CELLS // max(self.size, 1))
+        for start in range(0, len(targets), chunk):
+            rows = targets[start:start + chunk]
+            scores = self.matrix[rows] @ self.matrix[:self.size].T
+            text = self._text_scores(rows)
+            if text is not None:
+                text_scores, has_text = text
+                scores = self._blend(scores, text_scores, has_text[rows, None] & has_text[None, :])
+            scores[np.arange(len(rows)), rows] = -np.inf  # never recommend the bike itself
+            if self.size > k:
+                best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                best = np.broadcast_to(np.arange(self.size), (len(rows), self.size))
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            for bike_id, cols, col_scores in zip(bike_ids[start:start + chunk], best, best_scores):
+                keep = col_scores > threshold
+                out[bike_id] = [(int(self.ids[j]), float(score)) for j, score in zip(cols[keep], col_scores[keep])]
+        return out
+
+    def _tree_neighbours(self, points, n):
+        """
+        Tree positions of the n nearest rows to each point, and the cosine of
+        the n-th one: no row outside those positions scores higher numerically
+        (-inf once n covers the whole tree).
+        """
+        n = min(n, len(self._tree_ids))
+        if not n:
+            return np.zeros((len(points), 0), dtype=np.int64), np.full(len(points), -np.inf)
+        distances, positions = self._tree.query(points, k=n)
+        distances = distances.reshape(len(points), n)
+        positions = positions.reshape(len(points), n)
+        if n == len(self._tree_ids):
+            return positions, np.full(len(points), -np.inf)
+        # unit vectors: |a - b|^2 = 2 - 2 cos
+        return positions, 1 - distances[:, -1] ** 2 / 2
+
+    def _exact(self, i, rows, textless=None):
+        """Similarity of row i to rows; text blended in unless textless is None."""
+        scores = self.matrix[rows] @ self.matrix[i] if len(rows) else np.zeros(0)
+        if textless is not None and len(rows):
+            scores = self._blend(scores, self.text.dots(i, rows), ~np.isin(rows, textless))
+        return scores
+
+    def _similar_tree(self, bike_ids, targets, k, threshold):
+        """
+        Exact top k from a candidate set: the tree's numeric neighbours, rows
+        changed since the tree was built and, with the text channel on, rows
+        without text (a bike sharing no word with the target is then held to
+        (1 - w) times its numeric score) plus the rows sharing a word whose
+        text score could still lift them into the top k. When that set cannot
+        rule out the rest of the catalogue, the tree is asked for twice as
+        many neighbours (a lower bound leaves more words unread); past
+        TREE_SCAN_FRACTION of the catalogue the bike is scanned instead.
+        """
+        if self._tree is None:
+            self._build_tree()
+        text_on = self._text_on()
+        w = text_weight() if text_on else 0.0
+        # every stale id may displace one valid neighbour, plus the bike itself
+        n = k + 1 + len(self._stale)
+        limit = max(n, TREE_SCAN_FRACTION * self.size)
+        if text_on:
+            n = int(min(max(n, TREE_TEXT_NEIGHBOURS), limit))
+        positions, bounds = self._tree_neighbours(self.matrix[targets], n)
+        textless = self.text.textless(self.size) if text_on else None
+        # tree rows are only current for ids untouched since the build
+        stale_ids = np.array(sorted(self._stale), dtype=self._tree_ids.dtype)
+        stale_rows = np.array([self.rows[c] for c in self._stale if c in self.rows], dtype=np.int64)
+        out, scan = {}, []
+        for bike_id, i, pos, bound in zip(bike_ids, targets, positions, bounds):
+            with_text = text_on and self.text.has_text(i)
+            scale = 1 - w if with_text else 1.0
+            width = n
+            while True:
+                pos = pos[pos < len(self._tree_ids)]
+                rows = np.union1d(self._tree_rows[pos[~np.isin(self._tree_ids[pos], stale_ids)]], stale_rows)
+                if with_text:
+                    rows = np.union1d(rows, textless)
+                rows = rows[rows != i]
+                best_rows, best_scores = _top_k(rows, self._exact(i, rows, textless if with_text else None), k, threshold)
+                full = len(best_scores) == k
+                # rows outside the neighbours score at most cap numerically, + w * text with the channel on
+                cap = scale * bound
+                extra = np.zeros(0, dtype=np.int64)
+                if cap <= threshold or (full and best_scores[-1] >= cap):
+                    if not with_text or bound == -np.inf:
+                        break
+                    floor = best_scores[-1] if full else threshold
+                    extra = self.text.hits(i, self.size, (floor - cap) / w, limit)
+                    if extra is not None:
+                        extra = extra[(extra != i) & ~np.isin(extra, rows)]
+                        extra = extra[cap + w * self.text.dots(i, extra) > floor]
+                        break
+                if width >= limit:
+                    scan.append((bike_id, i))
+                    break
+                width *= 2
+                pos, bound = self._tree_neighbours(self.matrix[i][None, :], width)
+                pos, bound = pos[0], bound[0]
+            if scan and scan[-1][0] == bike_id:
+                continue
+            if len(extra):
+                best_rows, best_scores = _top_k(
+                    np.concatenate([best_rows, extra]),
+                    np.concatenate([best_scores, self._exact(i, extra, textless)]), k, threshold,
+                )
+            out[bike_id] = [(int(self.ids[j]), float(score)) for j, score in zip(best_rows, best_scores)]
+        if scan:
+            ids, rows = zip(*scan)
+            out.update(self._similar_scan(list(ids), np.array(rows, dtype=np.int64), k, threshold))
+        return {bike_id: out[bike_id] for bike_id in bike_ids}
+
+
+_lock = threading.RLock()
+_index = None
+_version = None
+_built_at = 0.0
+_snapshot = None  # directory of the shared snapshot _index maps, if any
+_waiting_since = None  # when catch-up first stalled on unlogged changes
+
+
+def build_index(conn):
+    """FeatureIndex over the whole bikes table, streamed from a server-side cursor."""
+    cursor = server_side_cursor(conn)
+    try:
+        cursor.execute(f"SELECT {FEATURE_COLUMNS} FROM bikes")
+        return FeatureIndex.build(iter_rows(cursor))
+    finally:
+        cursor.close()
+
+
+def _fetch_row(conn, bike_id):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {FEATURE_COLUMNS} FROM bikes WHERE id = %s", (bike_id,))
+    return cursor.fetchone()
+
+
+def _apply_changes(conn, bike_ids):
+    """Re-read the given bikes and upsert them into _index (remove the ones gone)."""
+    bike_ids = list(dict.fromkeys(bike_ids))
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {FEATURE_COLUMNS} FROM bikes WHERE id IN ({', '.join(['%s'] * len(bike_ids))})",
+        tuple(bike_ids),
+    )
+    rows = {row[0]: row for row in cursor.fetchall()}
+    for bike_id in bike_ids:
+        if bike_id in rows:
+            _index.upsert(rows[bike_id])
+        else:
+            _index.remove(bike_id)
+
+
+def _catch_up(conn, version):
+    """
+    Bring _index from _version up to `version` by replaying the logged
+    changes. Returns False when only a rebuild can: the log has a gap, or
+    its newest entries stayed missing for longer than CHANGE_LOG_WAIT.
+    """
+    global _version, _waiting_since
+    changes = cache.catalog_changes(_version, version)
+    if changes is None:
+        return False
+    bike_ids, reached = changes
+    if bike_ids:
+        _apply_changes(conn, bike_ids)
+    if reached == version or reached != _version:
+        _waiting_since = None
+    _version = reached
+    if reached == version:
+        return True
+    now = time.monotonic()
+    if _waiting_since is None:
+        _waiting_since = now
+    return now - _waiting_since < CHANGE_LOG_WAIT
+
+
+def get_index(conn):
+    """This worker's FeatureIndex: built when missing, caught up with logged writes, rebuilt on gaps."""
+    global _index, _version, _built_at
+    with _lock:
+        version = cache.catalog_version()
+        if _index is None:
+            stale = True
+        elif version is None:
+            stale = time.monotonic() - _built_at > _env_float('RECOMMENDER_MAX_AGE', 300)
+        else:
+            stale = version != _version and not _catch_up(conn, version)
+        if stale:
+            root = _shared_root()
+            if root:
+                _load_shared(conn, root, version)
+                if _index is not None and version is not None and _version != version:
+                    # the snapshot may be older than the log reaches: replay the rest
+                    _catch_up(conn, version)
+            else:
+                _index = build_index(conn)
+                _version = version
+                _built_at = time.monotonic()
+        return _index
+
+
+def _shared_root():
+    """RECOMMENDER_SHARED_DIR: where workers share one memory-mapped snapshot (unset = per worker)."""
+    return os.getenv('RECOMMENDER_SHARED_DIR', '').strip() or None
+
+
+def _snapshot_fresh(meta, version):
+    """Usable as is, or (with Redis) at most a replay of logged changes behind."""
+    if meta is None:
+        return False
+    if version is not None:
+        return meta.get('version') == version or cache.catalog_changes(meta.get('version'), version) is not None
+    return time.time() - meta.get('built_at', 0) <= _env_float('RECOMMENDER_MAX_AGE', 300)
+
+
+def _load_shared(conn, root, version):
+    """
+    Point _index at the current shared snapshot, rebuilding it first when
+    stale. One worker rebuilds (under the build lock) while the others keep
+    serving the snapshot they have; a worker with none waits for it.
+    """
+    global _index, _version, _built_at, _snapshot
+    path = shared_arrays.current_path(root)
+    meta = shared_arrays.read_meta(path) if path else None
+    if not _snapshot_fresh(meta, version):
+        with shared_arrays.build_lock(root, blocking=_index is None and meta is None) as held:
+            if held:
+                # whoever held the lock before us may have just published
+                path = shared_arrays.current_path(root)
+                meta = shared_arrays.read_meta(path) if path else None
+                if not _snapshot_fresh(meta, version):
+                    arrays, meta = build_index(conn).snapshot()
+                    meta.update(version=version, built_at=time.time())
+                    path = shared_arrays.publish(root, arrays, meta)
+    if meta is None:
+        return  # someone else is building the first snapshot; keep what we have
+    if path != _snapshot:
+        _index = FeatureIndex.from_snapshot(path, meta)
+        _snapshot = path
+    # a stale snapshot keeps its own version, so the next request checks again
+    _version = meta.get('version')
+    _built_at = time.monotonic() - max(0.0, time.time() - meta['built_at'])
+
+
+_run = None
+_run_checked_at = None
+
+
+def _rollback_quietly(conn):
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+
+def latest_run(conn):
+    """
+    Last offline run as {'max_bike_id', 'k', 'threshold'}, or None (no run
+    yet, or no table). Re-read at most every RECOMMENDER_RUN_CHECK seconds.
+    """
+    global _run, _run_checked_at
+    now = time.monotonic()
+    if _run_checked_at is not None and now - _run_checked_at < _env_float('RECOMMENDER_RUN_CHECK', 60):
+        return _run
+    run = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT max_bike_id, k, threshold FROM bike_recommendation_runs ORDER BY id DESC LIMIT 1")
+        row = cursor.fetchone()
+        if row:
+            run = {'max_bike_id': int(row[0]), 'k': int(row[1]), 'threshold': float(row[2])}
+    except Exception:
+        _rollback_quietly(conn)  # table not migrated yet: live only
+    _run, _run_checked_at = run, now
+    return run
+
+
+def precomputed(conn, bike_ids, k, threshold):
+    """
+    Neighbours from the last offline run for the bikes it covered, via the
+    (bike_id, rec_rank) primary key. Bikes newer than the run, missing ones,
+    and requests asking for more than the run stored are left to the caller.
+    """
+    run = latest_run(conn)
+    if run is None or k > run['k'] or threshold < run['threshold']:
+        return {}
+    covered = [b for b in bike_ids if b <= run['max_bike_id']]
+    if not covered:
+        return {}
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""SELECT b.id, r.recommended_id, r.similarity
+            FROM bikes b
+            LEFT JOIN bike_recommendations r ON r.bike_id = b.id AND r.rec_rank < %s
+            WHERE b.id IN ({', '.join(['%s'] * len(covered))})
+            ORDER BY b.id, r.rec_rank""",
+        (k, *covered),
+    )
+    out = {}
+    for bike_id, rec_id, similarity in cursor.fetchall():
+        recs = out.setdefault(bike_id, [])
+        if rec_id is not None and similarity > threshold:
+            recs.append((int(rec_id), float(similarity)))
+    return out
+
+
+def recommend_many(conn, bike_ids, k=None, threshold=None):
+    """
+    Most similar bikes for each of bike_ids: {bike_id: [(id, similarity), ...]}.
+    Ids that do not exist are left out. k / threshold default to
+    RECOMMENDER_K / RECOMMENDER_THRESHOLD.
+    """
+    k = default_k() if k is None else max(1, min(k, MAX_K))
+    threshold = default_threshold() if threshold is None else threshold
+    out = precomputed(conn, bike_ids, k, threshold)
+    live = [b for b in bike_ids if b not in out]
+    if live:
+        out.update(_recommend_live(conn, live, k, threshold))
+    return out
+
+
+def _recommend_live(conn, bike_ids, k, threshold):
+    with _lock:
+        index = get_index(conn)
+        unknown = [b for b in bike_ids if b not in index]
+        if unknown:
+            # written after the last build (or gone): check the table once
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {FEATURE_COLUMNS} FROM bikes WHERE id IN ({', '.join(['%s'] * len(unknown))})",
+                tuple(unknown),
+            )
+            for row in cursor.fetchall():
+                index.upsert(row)
+        known = [b for b in bike_ids if b in index]
+        return index.similar_many(known, k=k, threshold=threshold) if known else {}
+
+
+def recommend(conn, bike_id, k=None, threshold=None):
+    """recommend_many() for one bike; None when it does not exist."""
+    return recommend_many(conn, [bike_id], k=k, threshold=threshold).get(bike_id)
+
+
+def _applied(version):
+    # our own write: stay fresh only if nobody else wrote in between
+    global _version
+    if version is not None and _version is not None and version == _version + 1:
+        _version = version
+
+
+def bike_changed(conn, bike_id, version=None):
+    """Re-encode one bike after a create/update (version: the bumped catalogue version)."""
+    with _lock:
+        if _index is None:
+            return
+        row = _fetch_row(conn, bike_id)
+        if row is None:
+            _index.remove(bike_id)
+        else:
+            _index.upsert(row)
+        _applied(version)
+
+
+def bike_removed(bike_id, version=None):
+    with _lock:
+        if _index is None:
+            return
+        _index.remove(bike_id)
+        _applied(version)
+
+
+def reset():
+    """Drop this worker's matrix and run info; the next request reloads them."""
+    global _index, _version, _run, _run_checked_at, _snapshot, _waiting_since
+    with _lock:
+        _index = None
+        _version = None
+        _snapshot = None
+        _waiting_since = None
+        _run = _run_checked_at = None
@@ -1,9 +1,17 @@
-from flask import Blueprint, jsonify, request, session
-from db import get_connection
+from flask import Blueprint, current_app, jsonify, request, session, stream_with_context
+import base64
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import sys
+from db import get_db, is_postgres, iter_rows, server_side_cursor
+import cache
+import geo
+from search import search_clause, suggest
+from serialization import RowPlan, dumps, json_response, to_float, to_iso
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
 
 data_bp = Blueprint('data', __name__)
 
@@ -22,41 +30,449 @@ def _require_valid_user():
     if not uid:
         return None, (jsonify({'error': 'Authentication required'}), 401)
     try:
-        conn = get_connection()
+        conn = get_db()
         cur = conn.cursor()
         cur.execute('SELECT id FROM users WHERE id=%s', (uid,))
         row = cur.fetchone()
         if row:
-            conn.close()
             return uid, None
         # user id missing in DB -> try recreate if we have the name
         if name:
             cur.execute('INSERT INTO users (name, created_at) VALUES (%s, %s) RETURNING id', (name, datetime.now()))
             new_id = cur.fetchone()[0]
             conn.commit()
-            conn.close()
             session['user_id'] = new_id
             return new_id, None
-        conn.close()
     except Exception:
-        # fall through to auth required
-        pass
+        # fall through to auth required, leaving the request connection usable
+        try:
+            get_db().rollback()
+        except Exception:
+            pass
     session.clear()
     return None, (jsonify({'error': 'Authentication required'}), 401)
 
 
+def _to_float(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return None
+
+
+def _near_args():
+    """
+    Parse `near=lat,lon` / `radius_km` for radius search.
+    Returns (lat, lon, radius_km), or None when `near` is absent.
+    Raises ValueError on malformed input.
+    """
+    raw = (request.args.get('near') or '').strip()
+    if not raw:
+        return None
+    return geo.parse_near(raw, request.args.get('radius_km'))
+
+
+def _sort_arg(near):
+    """
+    Parse `sort=` for the bike listing: distance when `near` is given,
+    else relevance (which only changes the order for search=).
+    Raises ValueError on unknown or unusable values.
+    """
+    sort = request.args.get('sort') or ('distance' if near else 'relevance')
+    if sort not in LISTING_SORTS:
+        raise ValueError('sort must be one of: ' + ', '.join(LISTING_SORTS))
+    if sort == 'distance' and near is None:
+        raise ValueError('sort=distance requires near=lat,lon')
+    return sort
+
+
+def _listing_sort_key(sort, near, rank):
+    """Leading sort key ahead of (created_at, id) as (sql, params, descending), or None."""
+    if sort == 'distance':
+        return (*geo.distance_sql(*near[:2]), False)
+    if sort == 'relevance' and rank:
+        return (rank[0], rank[1], True)
+    return None
+
+
+def _listing_order_sql(sort_key):
+    """ORDER BY of the bike listing; the sort key is selected AS sort_key."""
+    if sort_key:
+        direction = 'DESC' if sort_key[2] else 'ASC'
+        return f" ORDER BY sort_key {direction}, b.created_at DESC, b.id DESC"
+    return " ORDER BY b.created_at DESC, b.id DESC"
+
+
+def _owner_arg():
+    """
+    Parse `owner=<user id>` for profile listings.
+    Returns the id, or None when `owner` is absent.
+    Raises ValueError on malformed input, rather than dropping the filter.
+    """
+    raw = (request.args.get('owner') or '').strip()
+    if not raw:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError('owner must be an integer user id') from None
+
+
+def _bike_filters(conn):
+    """
+    Build the WHERE clauses for the listing filters in the query string
+    (type, price ranges, excludeMine, owner, search, near). Shared by every listing-shaped
+    query so they all honour the same filter set.
+    Returns: (where, params, rank)
+      - where/params: lists, ready to be extended by the caller
+      - rank: (sql, params) relevance expression for full-text search, else None
+    """
+    filter_type = request.args.get('type')
+    min_sale = _to_float(request.args.get('minSalePrice'))
+    max_sale = _to_float(request.args.get('maxSalePrice'))
+    min_rent = _to_float(request.args.get('minRentalPrice'))
+    max_rent = _to_float(request.args.get('maxRentalPrice'))
+    exclude_mine = request.args.get('excludeMine') in ('1', 'true', 'True')
+    user_id_ex = session.get('user_id') if exclude_mine else None
+    search_text = (request.args.get('search') or '').strip()
+
+    where = []
+    params = []
+    if filter_type and filter_type in ['venta', 'alquiler']:
+        # IN rather than OR so PostgreSQL can drive one scan of idx_bikes_sale_type_created_at
+        where.append("b.sale_type IN (%s, 'ambos')")
+        params.append(filter_type)
+    if user_id_ex:
+        where.append("(b.owner_id IS NULL OR b.owner_id <> %s)")
+        params.append(user_id_ex)
+    owner_id = _owner_arg()
+    if owner_id is not None:
+        # profile listings: index range scan on (owner_id, created_at)
+        where.append("b.owner_id = %s")
+        params.append(owner_id)
+
+    near = _near_args()
+    if near is not None:
+        # bounding box on idx_bikes_lat_lon, then the exact haversine check
+        geo_where, geo_params = geo.radius_clause(*near)
+        where.extend(geo_where)
+        params.extend(geo_params)
+
+    rank = None
+    if search_text:
+        clause, clause_params, rank_sql, rank_params = search_clause(conn, search_text)
+        where.append(clause)
+        params.extend(clause_params)
+        if rank_sql:
+            rank = (rank_sql, rank_params)
+
+    # Price filters
+    if filter_type == 'venta':
+        if min_sale is not None:
+            where.append("b.sale_price IS NOT NULL AND b.sale_price >= %s")
+            params.append(min_sale)
+        if max_sale is not None:
+            where.append("b.sale_price IS NOT NULL AND b.sale_price <= %s")
+            params.append(max_sale)
+    elif filter_type == 'alquiler':
+        if min_rent is not None:
+            where.append("b.rental_price IS NOT NULL AND b.rental_price >= %s")
+            params.append(min_rent)
+        if max_rent is not None:
+            where.append("b.rental_price IS NOT NULL AND b.rental_price <= %s")
+            params.append(max_rent)
+    else:
+        price_clauses = []
+        price_params = []
+        sale_parts = []
+        if min_sale is not None:
+            sale_parts.append("b.sale_price >= %s")
+            price_params.append(min_sale)
+        if max_sale is not None:
+            sale_parts.append("b.sale_price <= %s")
+            price_params.append(max_sale)
+        if sale_parts:
+            price_clauses.append("(b.sale_price IS NOT NULL AND " + " AND ".join(sale_parts) + ")")
+
+        rent_parts = []
+        if min_rent is not None:
+            rent_parts.append("b.rental_price >= %s")
+            price_params.append(min_rent)
+        if max_rent is not None:
+            rent_parts.append("b.rental_price <= %s")
+            price_params.append(max_rent)
+        if rent_parts:
+            price_clauses.append("(b.rental_price IS NOT NULL AND " + " AND ".join(rent_parts) + ")")
+
+        if price_clauses:
+            where.append("(" + " OR ".join(price_clauses) + ")")
+            params.extend(price_params)
+    return where, params, rank
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# relevance only applies to full-text searches; otherwise it means newest first
+LISTING_SORTS = ('relevance', 'newest', 'distance')
+
+
+def _encode_cursor(created_at, bike_id, rank=None):
+    """
+    Opaque next-page token holding the sort key of the last row:
+    (created_at, id), prefixed by the leading sort value (relevance rank or
+    distance) when the listing is not in plain newest-first order.
+    """
+    created = created_at.isoformat() if hasattr(created_at, 'isoformat') else created_at
+    key = [created, bike_id] if rank is None else [float(rank), created, bike_id]
+    raw = json.dumps(key).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(token):
+    """Inverse of _encode_cursor: returns (created_at, id, rank or None)."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        rank = float(key.pop(0)) if len(key) == 3 else None
+        created, bike_id = key
+        bike_id = int(bike_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    try:
+        created = datetime.fromisoformat(created)
+    except (TypeError, ValueError):
+        pass
+    return created, bike_id, rank
+
+
+def _page_args():
+    """
+    Parse `limit` / `after` for keyset pagination.
+    Returns (limit, after) where both are None for the legacy unpaginated list.
+    Raises ValueError on malformed input.
+    """
+    raw_limit = request.args.get('limit')
+    token = request.args.get('after')
+    if raw_limit is None and not token:
+        return None, None
+    limit = DEFAULT_PAGE_SIZE
+    if raw_limit is not None:
+        try:
+            limit = int(raw_limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = _decode_cursor(token) if token else None
+    return limit, after
+
+
+# JSON field -> (SQL expression, converter), in response order
+_BIKE_FIELDS = {
+    'id': ('b.id', None),
+    'title': ('b.title', None),
+    'sale_price': ('b.sale_price', to_float),
+    'rental_price': ('b.rental_price', to_float),
+    'sale_type': ('b.sale_type', None),
+    'model': ('b.model', None),
+    'description': ('b.description', None),
+    'condition': ('b.bike_condition', None),
+    'created_at': ('b.created_at', to_iso),
+    'owner_id': ('b.owner_id', None),
+    'owner_name': ('u.name', None),
+    'image_url': ('b.image_url', None),
+    'location_name': ('b.location_name', None),
+    'latitude': ('b.latitude', to_float),
+    'longitude': ('b.longitude', to_float),
+}
+
+# List-only field: the start of the description, which is all the list views
+# show. It has its own name so a cut-down text is never mistaken for the
+# real description (and saved back by an edit form).
+DESCRIPTION_SNIPPET_CHARS = 160
+_LIST_FIELDS = dict(_BIKE_FIELDS, snippet=(f"SUBSTR(b.description, 1, {DESCRIPTION_SNIPPET_CHARS})", None))
+
+# Default list projection ("card"): every field, with snippet instead of description
+_CARD_FIELDS = tuple(name for name in _LIST_FIELDS if name != 'description')
+
+
+@lru_cache(maxsize=64)
+def _projection(names, offset=0):
+    """
+    SELECT list and precompiled RowPlan for the given fields, built once per
+    query shape.
+    Returns: (sql, plan) where plan reads row[offset:] into a dict.
+    """
+    sql = ", ".join(_LIST_FIELDS[name][0] for name in names)
+    plan = RowPlan([(name, _LIST_FIELDS[name][1]) for name in names], offset=offset)
+    return sql, plan
+
+
+def _fields_arg():
+    """
+    Parse `fields=`: 'card' (default), 'full' (every column, description
+    whole, no snippet), or a comma-separated list of field names (id is
+    always included).
+    Returns the field names. Raises ValueError on unknown fields.
+    """
+    raw = (request.args.get('fields') or 'card').strip()
+    if raw == 'card':
+        return _CARD_FIELDS
+    if raw == 'full':
+        return tuple(_BIKE_FIELDS)
+    names = ['id'] + [n.strip() for n in raw.split(',') if n.strip()]
+    unknown = [n for n in names if n not in _LIST_FIELDS]
+    if unknown:
+        raise ValueError('Unknown field(s): ' + ', '.join(unknown))
+    return tuple(dict.fromkeys(names))
+
+
+# Full projection shared by the detail endpoint
+_BIKE_COLUMNS, _bike_to_dict = _projection(tuple(_BIKE_FIELDS))
+
+
+def _listing_cache_params():
+    """
+    Normalised query string identifying a listing response: blank values
+    dropped, prices parsed, and excludeMine resolved to the session user.
+    Values are only stripped, as _bike_filters does: inner whitespace is
+    part of a LIKE search and so of the response.
+    """
+    params = {}
+    for key in request.args:
+        values = [v.strip() for v in request.args.getlist(key)]
+        values = [v for v in values if v]
+        if not values:
+            continue
+        if key in ('minSalePrice', 'maxSalePrice', 'minRentalPrice', 'maxRentalPrice'):
+            values = [_to_float(v) for v in values]
+        params[key] = values
+    if 'excludeMine' in params:
+        exclude_mine = request.args.get('excludeMine') in ('1', 'true', 'True')
+        params['excludeMine'] = session.get('user_id') if exclude_mine else None
+    return params
+
+
+def _cached_json(body):
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+
+def _stream_requested():
+    return request.args.get('stream') in ('1', 'true', 'True')
+
+
+def _stream_list(key, cursor, to_dict, limit=None, finish=None, etag=None):
+    """
+    Stream {"<key>": [...], "count": n, ...} straight from a server-side
+    cursor, one fetchmany batch at a time, so worker memory stays flat no
+    matter how many rows match. Rows past `limit` are only read (look-ahead);
+    finish(last_row, has_more) may return extra top-level fields.
+    """
+    def generate():
+        count = 0
+        last = None
+        has_more = False
+        try:
+            yield b'{' + dumps(key) + b':['
+            for row in iter_rows(cursor):
+                if limit is not None and count >= limit:
+                    has_more = True
+                    continue
+                yield (b',' if count else b'') + dumps(to_dict(row))
+                count += 1
+                last = row
+            extra = finish(last, has_more) if finish else {}
+            extra = {'count': count, **extra}
+            # re-open the closing object so the tail keys land after the array
+            yield b'],' + dumps(extra)[1:]
+        except Exception:
+            # headers are already sent; all we can do is log and cut the body short
+            logging.exception('Streaming %s failed', key)
+            raise
+        finally:
+            cursor.close()
+
+    # stream_with_context keeps the request (and its DB connection) alive until the end
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _not_modified(etag):
+    """304 response when the client's If-None-Match already has this ETag."""
+    if etag and request.if_none_match.contains(etag):
+        return _conditional(current_app.response_class(status=304), etag)
+    return None
+
+
+def _conditional(response, etag):
+    # private: bodies depend on the session; no-cache: always revalidate
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def _cache_probe(namespace, params):
+    """
+    Catalogue-versioned cache lookup shared by the listing-shaped reads.
+    Returns (cache_key, etag, response): response is a 304 or a cached hit to
+    return as-is, else None. key/etag are None when Redis is unavailable.
+    """
+    version = cache.catalog_version()
+    if version is None:
+        return None, None, None
+    # the version counter changes on every bike write: a cheap strong ETag
+    cache_key = cache.make_key(namespace, params, version)
+    etag = _etag(cache_key)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return cache_key, etag, not_modified
+    body = cache.get(cache_key)
+    if body is not None:
+        return cache_key, etag, _conditional(_cached_json(body), etag)
+    return cache_key, etag, None
+
+
+def _cache_store(response, cache_key, etag):
+    if cache_key:
+        cache.put(cache_key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+    # without Redis and no cheaper marker: hash the body, so a 304 saves the
+    # transfer but not the query
+    return _conditional(response, etag or _etag(response.get_data()))
+
+
+def _listing_marker_etag(cursor, where, params, cache_params):
+    """
+    ETag for a listing when Redis (and its version counter) is unavailable:
+    one aggregate over the filtered rows instead of the listing itself. New
+    bikes move MAX(id), deletions COUNT(*) and edits MAX(updated_at).
+    """
+    sql = "SELECT COUNT(*), MAX(b.id), MAX(b.updated_at) FROM bikes b LEFT JOIN users u ON b.owner_id = u.id"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    cursor.execute(sql, tuple(params))
+    return _etag('bikes', cache_params, *cursor.fetchone())
+
+
 @data_bp.route('/api/data', methods=['GET', 'POST'])
 @data_bp.route('/api/bikes', methods=['GET', 'POST'])
 def bikes():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
         if request.method == 'POST':
             # Require login
             user_id, err = _require_valid_user()
             if err:
                 return err
+            conn = get_db()
+            cursor = conn.cursor()
             payload = request.get_json(silent=True) or {}
 
             # Required/optional fields
@@ -79,121 +495,264 @@ def bikes():
             if sale_type in ['alquiler', 'ambos'] and sale_price and not rental_price:
                 rental_price = float(sale_price) * 0.15
 
-            cursor.execute(
-                     """INSERT INTO bikes (title, sale_price, rental_price, sale_type, model, description, bike_condition, image_url, owner_id, created_at, location_name, latitude, longitude)
-                         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-                     (title, sale_price, rental_price, sale_type, model, description, bike_condition, image_url, user_id, datetime.now(), location_name, latitude, longitude)
-            )
+            insert_sql = """INSERT INTO bikes (title, sale_price, rental_price, sale_type, model, description, bike_condition, image_url, owner_id, created_at, location_name, latitude, longitude)
+                         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+            insert_params = (title, sale_price, rental_price, sale_type, model, description, bike_condition, image_url, user_id, datetime.now(), location_name, latitude, longitude)
+            if is_postgres(conn):
+                cursor.execute(insert_sql + " RETURNING id", insert_params)
+                new_id = cursor.fetchone()[0]
+            else:
+                cursor.execute(insert_sql, insert_params)
+                new_id = cursor.lastrowid
             conn.commit()
+            _catalog_changed(conn, new_id)
             return jsonify({'success': True}), 201
 
-        # GET bikes with filters
-        def _to_float(val):
-            try:
-                return float(val)
-            except (TypeError, ValueError):
-                return None
-
-        filter_type = request.args.get('type')
-        min_sale = _to_float(request.args.get('minSalePrice'))
-        max_sale = _to_float(request.args.get('maxSalePrice'))
-        min_rent = _to_float(request.args.get('minRentalPrice'))
-        max_rent = _to_float(request.args.get('maxRentalPrice'))
-        exclude_mine = request.args.get('excludeMine') in ('1', 'true', 'True')
-        user_id_ex = session.get('user_id') if exclude_mine else None
-        search_text = (request.args.get('search') or '').strip()
+        # GET bikes with filters, optionally one keyset page at a time
+        try:
+            limit, after = _page_args()
+            fields = _fields_arg()
+            near = _near_args()
+            _owner_arg()
+            sort = _sort_arg(near)
+        except ValueError as exc:
+            return jsonify({'error': str(exc)}), 400
 
-        base_sql = (
-            "SELECT b.id, b.title, b.sale_price, b.rental_price, b.sale_type, b.model, "
-            "b.description, b.bike_condition, b.created_at, b.owner_id, u.name as owner_name, b.image_url, b.location_name, b.latitude, b.longitude "
-            "FROM bikes b LEFT JOIN users u ON b.owner_id = u.id"
-        )
-        where = []
-        params = []
-        if filter_type and filter_type in ['venta', 'alquiler']:
-            where.append("(b.sale_type = %s OR b.sale_type = 'ambos')")
-            params.append(filter_type)
-        if user_id_ex:
-            where.append("(b.owner_id IS NULL OR b.owner_id <> %s)")
-            params.append(user_id_ex)
-
-        if search_text:
-            where.append("(b.title LIKE %s OR b.description LIKE %s OR u.name LIKE %s)")
-            like = f"%{search_text}%"
-            params.extend([like, like, like])
-
-        # Price filters
-        if filter_type == 'venta':
-            if min_sale is not None:
-                where.append("b.sale_price IS NOT NULL AND b.sale_price >= %s")
-                params.append(min_sale)
-            if max_sale is not None:
-                where.append("b.sale_price IS NOT NULL AND b.sale_price <= %s")
-                params.append(max_sale)
-        elif filter_type == 'alquiler':
-            if min_rent is not None:
-                where.append("b.rental_price IS NOT NULL AND b.rental_price >= %s")
-                params.append(min_rent)
-            if max_rent is not None:
-                where.append("b.rental_price IS NOT NULL AND b.rental_price <= %s")
-                params.append(max_rent)
-        else:
-            price_clauses = []
-            price_params = []
-            sale_parts = []
-            if min_sale is not None:
-                sale_parts.append("b.sale_price >= %s")
-                price_params.append(min_sale)
-            if max_sale is not None:
-                sale_parts.append("b.sale_price <= %s")
-                price_params.append(max_sale)
-            if sale_parts:
-                price_clauses.append("(b.sale_price IS NOT NULL AND " + " AND ".join(sale_parts) + ")")
-
-            rent_parts = []
-            if min_rent is not None:
-                rent_parts.append("b.rental_price >= %s")
-                price_params.append(min_rent)
-            if max_rent is not None:
-                rent_parts.append("b.rental_price <= %s")
-                price_params.append(max_rent)
-            if rent_parts:
-                price_clauses.append("(b.rental_price IS NOT NULL AND " + " AND ".join(rent_parts) + ")")
-
-            if price_clauses:
-                where.append("(" + " OR ".join(price_clauses) + ")")
-                params.extend(price_params)
+        cache_params = _listing_cache_params()
+        cache_key, etag, cached = _cache_probe('bikes', cache_params)
+        if cached:
+            return cached
+
+        conn = get_db()
+        cursor = conn.cursor()
 
+        where, params, rank = _bike_filters(conn)
+        if etag is None and limit is None:
+            # the unpaginated list reads every matching row; a page is one LIMIT
+            # range scan, already about as cheap as the marker itself
+            etag = _listing_marker_etag(cursor, where, params, cache_params)
+            not_modified = _not_modified(etag)
+            if not_modified:
+                return not_modified
+        projection, plan = _projection(fields, offset=2)
+        sort_key = _listing_sort_key(sort, near, rank)
+        select_params = []
+        # id/created_at always lead the row: the keyset cursor needs them whatever the projection
+        base_sql = f"SELECT b.id, b.created_at, {projection}"
+        if sort_key:
+            # sort value goes last, used for ordering and the cursor
+            base_sql += f", {sort_key[0]} AS sort_key"
+            select_params.extend(sort_key[1])
+        base_sql += " FROM bikes b LEFT JOIN users u ON b.owner_id = u.id"
+        if after is not None:
+            after_created, after_id, after_key = after
+            # Keyset predicate matching the ORDER BY below
+            if sort_key and after_key is not None:
+                key_sql, key_params, descending = sort_key
+                op = '<' if descending else '>'
+                where.append(f"({key_sql} {op} %s OR ({key_sql} = %s AND (b.created_at, b.id) < (%s, %s)))")
+                params.extend(key_params + [after_key] + key_params + [after_key, after_created, after_id])
+            else:
+                where.append("(b.created_at, b.id) < (%s, %s)")
+                params.extend([after_created, after_id])
         if where:
             base_sql += " WHERE " + " AND ".join(where)
-        base_sql += " ORDER BY b.created_at DESC"
+        base_sql += _listing_order_sql(sort_key)
+        if limit is not None:
+            # one extra row tells us whether another page exists
+            base_sql += " LIMIT %s"
+            params.append(limit + 1)
+
+        to_dict = plan
+        if sort == 'distance':
+            def to_dict(row):
+                bike = plan(row)
+                bike['distance_km'] = round(float(row[-1]), 3)
+                return bike
+
+        if _stream_requested():
+            stream_cursor = server_side_cursor(conn)
+            stream_cursor.execute(base_sql, tuple(select_params + params))
+            return _stream_list(
+                'bikes', stream_cursor, to_dict, limit=limit,
+                finish=lambda last, more: {'next_cursor': _encode_cursor(last[1], last[0], last[-1] if sort_key else None) if more else None},
+                etag=etag,
+            )
 
-        cursor.execute(base_sql, tuple(params))
+        cursor.execute(base_sql, tuple(select_params + params))
         rows = cursor.fetchall()
-        bikes = []
-        for row in rows:
-            created_val = row[8]
-            created_str = created_val.isoformat() if hasattr(created_val, 'isoformat') else str(created_val) if created_val else None
-            bikes.append({
-                'id': row[0],
-                'title': row[1],
-                'sale_price': float(row[2]) if row[2] is not None else None,
-                'rental_price': float(row[3]) if row[3] is not None else None,
-                'sale_type': row[4],
-                'model': row[5],
-                'description': row[6],
-                'condition': row[7],
-                'created_at': created_str,
-                'owner_id': row[9],
-                'owner_name': row[10],
-                'image_url': row[11],
-                'location_name': row[12],
-                'latitude': float(row[13]) if row[13] is not None else None,
-                'longitude': float(row[14]) if row[14] is not None else None,
-            })
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = _encode_cursor(last[1], last[0], last[-1] if sort_key else None)
+        bikes = plan.many(rows) if to_dict is plan else [to_dict(row) for row in rows]
+
+        response = json_response({'bikes': bikes, 'count': len(bikes), 'next_cursor': next_cursor})
+        return _cache_store(response, cache_key, etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+SUGGEST_MIN_CHARS = 2
+SUGGEST_MAX_LIMIT = 20
 
-        conn.close()
-        return jsonify({'bikes': bikes, 'count': len(bikes)})
+
+@data_bp.route('/api/bikes/suggest', methods=['GET'])
+def suggest_bikes():
+    """Typeahead for the search boxes: top matching titles and models."""
+    q = (request.args.get('q') or '').strip()
+    if len(q) < SUGGEST_MIN_CHARS:
+        return jsonify({'suggestions': []})
+    limit = max(1, min(request.args.get('limit', 8, type=int), SUGGEST_MAX_LIMIT))
+    try:
+        return jsonify({'suggestions': suggest(get_db(), q[:100], limit)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@data_bp.route('/api/bikes/clusters', methods=['GET'])
+def bike_clusters():
+    """
+    Map markers for the visible area: bikes inside `bbox` grouped into a
+    grid whose cell size follows `zoom`, one row per non-empty cell with its
+    count and centroid. Honours the listing filters (type, prices, search...).
+    """
+    try:
+        bbox = geo.parse_bbox(request.args.get('bbox'))
+        zoom = request.args.get('zoom', type=int)
+        if zoom is None or not 0 <= zoom <= geo.MAX_ZOOM:
+            raise ValueError(f'zoom must be an integer between 0 and {geo.MAX_ZOOM}')
+        cell = geo.cell_size(zoom)
+        bbox = geo.snap_bbox(bbox, cell)
+        # malformed near=/owner= is a 400 here, not a 500 from _bike_filters
+        _near_args()
+        _owner_arg()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    try:
+        # keyed on the snapped box: nearby viewports share one tile
+        cache_params = dict(_listing_cache_params(), bbox=bbox, zoom=zoom)
+        cache_key, etag, cached = _cache_probe('clusters', cache_params)
+        if cached:
+            return cached
+
+        conn = get_db()
+        cursor = conn.cursor()
+        where, params, _ = _bike_filters(conn)
+        box_where, box_params = geo.bbox_clause(bbox)
+        cursor.execute(
+            f"""SELECT FLOOR(b.latitude / %s) AS cell_y, FLOOR(b.longitude / %s) AS cell_x,
+                       COUNT(*), AVG(b.latitude), AVG(b.longitude), MIN(b.id)
+                FROM bikes b LEFT JOIN users u ON b.owner_id = u.id
+                WHERE {' AND '.join(box_where + where)}
+                GROUP BY cell_y, cell_x
+                ORDER BY cell_y, cell_x""",
+            tuple([cell, cell] + box_params + params),
+        )
+        clusters = []
+        total = 0
+        for _, _, count, lat, lon, first_id in cursor.fetchall():
+            cluster = {'lat': to_float(lat), 'lon': to_float(lon), 'count': int(count)}
+            if count == 1:
+                # single bike: the map draws a pin linking to it
+                cluster['bike_id'] = first_id
+            clusters.append(cluster)
+            total += int(count)
+
+        response = json_response({
+            'clusters': clusters,
+            'count': len(clusters),
+            'total': total,
+            'cell_deg': cell,
+            'bbox': list(bbox),
+        })
+        return _cache_store(response, cache_key, etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Histogram bucket lower bounds (NOK); the last bucket is open-ended
+SALE_PRICE_BUCKETS = (0, 100, 250, 500, 1000, 2500, 5000)
+RENTAL_PRICE_BUCKETS = (0, 25, 50, 100, 250, 500)
+
+
+def _bucket_sql(column, edges):
+    """CASE expression mapping a price to its bucket index (NULL stays NULL)."""
+    whens = " ".join(f"WHEN {column} < {edge} THEN {i}" for i, edge in enumerate(edges[1:]))
+    return f"CASE WHEN {column} IS NULL THEN NULL {whens} ELSE {len(edges) - 1} END"
+
+
+def _histogram(counts, edges):
+    return [
+        {'min': edge, 'max': edges[i + 1] if i + 1 < len(edges) else None, 'count': counts.get(i, 0)}
+        for i, edge in enumerate(edges)
+    ]
+
+
+@data_bp.route('/api/bikes/facets', methods=['GET'])
+def bike_facets():
+    """
+    Filter panel counts for the current filter set: bikes per sale_type and
+    condition, plus sale and rental price histograms. One GROUP BY over the
+    (type, condition, sale bucket, rental bucket) combinations; the marginals
+    are summed here.
+    """
+    try:
+        # malformed near=/owner= is a 400 here, not a 500 from _bike_filters
+        _near_args()
+        _owner_arg()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+
+    try:
+        cache_key, etag, cached = _cache_probe('facets', _listing_cache_params())
+        if cached:
+            return cached
+
+        conn = get_db()
+        cursor = conn.cursor()
+        where, params, _ = _bike_filters(conn)
+        sql = f"""SELECT b.sale_type, b.bike_condition,
+                         {_bucket_sql('b.sale_price', SALE_PRICE_BUCKETS)} AS sale_bucket,
+                         {_bucket_sql('b.rental_price', RENTAL_PRICE_BUCKETS)} AS rental_bucket,
+                         COUNT(*)
+                  FROM bikes b LEFT JOIN users u ON b.owner_id = u.id"""
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY b.sale_type, b.bike_condition, sale_bucket, rental_bucket"
+        cursor.execute(sql, tuple(params))
+
+        total = 0
+        sale_types = {'venta': 0, 'alquiler': 0, 'ambos': 0}
+        conditions = {}
+        sale_buckets = {}
+        rental_buckets = {}
+        for sale_type, condition, sale_bucket, rental_bucket, count in cursor.fetchall():
+            count = int(count)
+            total += count
+            if sale_type:
+                sale_types[sale_type] = sale_types.get(sale_type, 0) + count
+            condition = (condition or '').strip()
+            if condition:
+                conditions[condition] = conditions.get(condition, 0) + count
+            if sale_bucket is not None:
+                sale_buckets[int(sale_bucket)] = sale_buckets.get(int(sale_bucket), 0) + count
+            if rental_bucket is not None:
+                rental_buckets[int(rental_bucket)] = rental_buckets.get(int(rental_bucket), 0) + count
+
+        response = json_response({
+            'total': total,
+            'sale_type': sale_types,
+            'condition': [
+                {'value': value, 'count': count}
+                for value, count in sorted(conditions.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            'sale_price': _histogram(sale_buckets, SALE_PRICE_BUCKETS),
+            'rental_price': _histogram(rental_buckets, RENTAL_PRICE_BUCKETS),
+        })
+        return _cache_store(response, cache_key, etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -217,15 +776,13 @@ def signup():
     if not name or not password:
         return jsonify({'error': 'name and password are required'}), 400
     try:
-        conn = get_connection()
+        conn = get_db()
         cur = conn.cursor()
         cur.execute('SELECT id FROM users WHERE name=%s', (name,))
         if cur.fetchone():
-            conn.close()
             return jsonify({'error': 'User already exists'}), 409
         pwd_hash = generate_password_hash(password)
-        is_postgres = conn.__class__.__module__.startswith('psycopg2')
-        if is_postgres:
+        if is_postgres(conn):
             cur.execute(
                 'INSERT INTO users (name, password_hash, created_at) VALUES (%s, %s, %s) RETURNING id',
                 (name, pwd_hash, datetime.now())
@@ -239,7 +796,6 @@ def signup():
             )
             user_id = cur.lastrowid
         conn.commit()
-        conn.close()
         session['user_id'] = user_id
         session['user_name'] = name
         return jsonify({'ok': True, 'user': {'id': user_id, 'name': name}}), 201
@@ -257,12 +813,11 @@ def login():
     if not password:
         return jsonify({'error': 'Password is required'}), 400
     try:
-        conn = get_connection()
+        conn = get_db()
         cur = conn.cursor()
         cur.execute('SELECT id, password_hash FROM users WHERE name=%s', (name,))
         row = cur.fetchone()
         if not row:
-            conn.close()
             return jsonify({'error': 'User not found. Please sign up.'}), 404
         user_id, pwd_hash = row[0], row[1]
         if pwd_hash:
@@ -274,7 +829,6 @@ def login():
             cur2 = conn.cursor()
             cur2.execute('UPDATE users SET password_hash=%s WHERE id=%s', (new_hash, user_id))
             conn.commit()
-        conn.close()
         session['user_id'] = user_id
         session['user_name'] = name
         return jsonify({'ok': True, 'user': {'id': user_id, 'name': name}})
@@ -288,13 +842,46 @@ def logout():
     return jsonify({'ok': True})
 
 
+@data_bp.route('/api/bikes/<int:bike_id>', methods=['GET'])
+def get_bike(bike_id):
+    """One bike with its owner, by primary key (used by the detail page)."""
+    try:
+        cache_key = etag = None
+        version = cache.catalog_version()
+        if version is not None:
+            cache_key = f'bike:v{version}:{bike_id}'
+            etag = _etag(cache_key)
+            not_modified = _not_modified(etag)
+            if not_modified:
+                return not_modified
+            body = cache.get(cache_key)
+            if body is not None:
+                return _conditional(_cached_json(body), etag)
+
+        cursor = get_db().cursor()
+        cursor.execute(
+            f"SELECT {_BIKE_COLUMNS} FROM bikes b LEFT JOIN users u ON b.owner_id = u.id WHERE b.id = %s",
+            (bike_id,)
+        )
+        row = cursor.fetchone()
+        if not row:
+            return jsonify({'error': 'Bike not found'}), 404
+        response = json_response({'bike': _bike_to_dict(row)})
+        if cache_key:
+            cache.put(cache_key, response.get_data())
+            response.headers['X-Cache'] = 'MISS'
+        return _conditional(response, etag or _etag(response.get_data()))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @data_bp.route('/api/bikes/<int:bike_id>', methods=['DELETE'])
 def delete_bike(bike_id):
     user_id, err = _require_valid_user()
     if err:
         return err
     try:
-        conn = get_connection()
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT owner_id FROM bikes WHERE id = %s', (bike_id,))
         row = cursor.fetchone()
@@ -304,7 +891,7 @@ def delete_bike(bike_id):
             return jsonify({'error': 'Not authorized'}), 403
         cursor.execute('DELETE FROM bikes WHERE id = %s', (bike_id,))
         conn.commit()
-        conn.close()
+        _catalog_changed(conn, bike_id, removed=True)
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -336,20 +923,51 @@ def update_bike(bike_id):
         if sale_type in ['alquiler', 'ambos'] and sale_price and not rental_price:
             rental_price = float(sale_price) * 0.15
 
-        conn = get_connection()
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute(
                 """UPDATE bikes SET title=%s, sale_price=%s, rental_price=%s, sale_type=%s,
-                    model=%s, description=%s, bike_condition=%s, image_url=%s, location_name=%s, latitude=%s, longitude=%s WHERE id=%s""",
-                (title, sale_price, rental_price, sale_type, model, description, bike_condition, image_url, location_name, latitude, longitude, bike_id)
+                    model=%s, description=%s, bike_condition=%s, image_url=%s, location_name=%s, latitude=%s, longitude=%s,
+                    updated_at=%s WHERE id=%s""",
+                (title, sale_price, rental_price, sale_type, model, description, bike_condition, image_url, location_name, latitude, longitude,
+                 datetime.now(), bike_id)
         )
         conn.commit()
-        conn.close()
+        _catalog_changed(conn, bike_id)
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _touch_conversation(conn, cursor, bike_id, sender_id, receiver_id, message_id, content, sent_at):
+    """
+    Upsert the `conversations` row for (bike, user pair) in the sender's
+    transaction. The message id decides which message is newest, so two
+    concurrent sends never move the summary backwards.
+    """
+    params = (bike_id, min(sender_id, receiver_id), max(sender_id, receiver_id), message_id, content, sent_at)
+    insert = """INSERT INTO conversations (bike_id, user_low, user_high, last_message_id, last_message, last_message_at)
+                VALUES (%s, %s, %s, %s, %s, %s)"""
+    if is_postgres(conn):
+        cursor.execute(
+            insert + """ ON CONFLICT (bike_id, user_low, user_high) DO UPDATE SET
+                last_message_id = EXCLUDED.last_message_id,
+                last_message = EXCLUDED.last_message,
+                last_message_at = EXCLUDED.last_message_at
+            WHERE conversations.last_message_id < EXCLUDED.last_message_id""",
+            params
+        )
+    else:
+        # MySQL assigns left to right: last_message_id has to go last
+        cursor.execute(
+            insert + """ ON DUPLICATE KEY UPDATE
+                last_message = IF(VALUES(last_message_id) > last_message_id, VALUES(last_message), last_message),
+                last_message_at = IF(VALUES(last_message_id) > last_message_id, VALUES(last_message_at), last_message_at),
+                last_message_id = GREATEST(last_message_id, VALUES(last_message_id))""",
+            params
+        )
+
+
 @data_bp.route('/api/messages', methods=['POST'])
 def send_message():
     user_id, err = _require_valid_user()
@@ -362,22 +980,21 @@ def send_message():
         content = (payload.get('content') or '').strip()
         if not bike_id or not receiver_id or not content:
             return jsonify({'error': 'bike_id, receiver_id, and content are required'}), 400
-        conn = get_connection()
+        conn = get_db()
         cursor = conn.cursor()
         # Validate receiver exists
         cursor.execute('SELECT id FROM users WHERE id=%s', (receiver_id,))
         if not cursor.fetchone():
-            conn.close()
             return jsonify({'error': 'Receiver not found'}), 400
         cursor.execute('SELECT id FROM bikes WHERE id = %s', (bike_id,))
         if not cursor.fetchone():
             return jsonify({'error': 'Bike not found'}), 404
-        is_postgres = conn.__class__.__module__.startswith('psycopg2')
-        if is_postgres:
+        sent_at = datetime.now()
+        if is_postgres(conn):
             cursor.execute(
                 """INSERT INTO messages (bike_id, sender_id, receiver_id, content, created_at)
                    VALUES (%s, %s, %s, %s, %s) RETURNING id""",
-                (bike_id, user_id, receiver_id, content, datetime.now())
+                (bike_id, user_id, receiver_id, content, sent_at)
             )
             row = cursor.fetchone()
             message_id = row[0] if row else None
@@ -385,174 +1002,278 @@ def send_message():
             cursor.execute(
                 """INSERT INTO messages (bike_id, sender_id, receiver_id, content, created_at)
                    VALUES (%s, %s, %s, %s, %s)""",
-                (bike_id, user_id, receiver_id, content, datetime.now())
+                (bike_id, user_id, receiver_id, content, sent_at)
             )
             message_id = cursor.lastrowid
+        _touch_conversation(conn, cursor, bike_id, user_id, int(receiver_id), message_id, content, sent_at)
         conn.commit()
-        conn.close()
         return jsonify({'ok': True, 'message_id': message_id}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+_message_plan = RowPlan([
+    ('id', None), ('bike_id', None), ('sender_id', None), ('receiver_id', None),
+    ('content', None), ('created_at', to_iso), ('sender_name', None), ('receiver_name', None),
+])
+
+
+MESSAGE_PAGE_SIZE = 50
+
+
+def _message_page_args():
+    """
+    Parse `before_id` / `after_id` / `limit` for a message thread.
+    Returns (before_id, after_id, limit); all None for the legacy full thread.
+    Raises ValueError on malformed input.
+    """
+    values = []
+    for name in ('before_id', 'after_id', 'limit'):
+        raw = request.args.get(name)
+        try:
+            values.append(int(raw) if raw not in (None, '') else None)
+        except ValueError:
+            raise ValueError(f'{name} must be an integer')
+    before_id, after_id, limit = values
+    if before_id is None and after_id is None and limit is None:
+        return None, None, None
+    limit = MESSAGE_PAGE_SIZE if limit is None else max(1, min(limit, MAX_PAGE_SIZE))
+    return before_id, after_id, limit
+
+
 @data_bp.route('/api/messages/bike/<int:bike_id>', methods=['GET'])
 def get_bike_messages(bike_id):
+    """
+    Messages of one thread, oldest first. Paginated by message id when any of
+    these is given:
+      - after_id: only messages newer than it (incremental refresh)
+      - before_id: the newest `limit` messages older than it (scrolling back)
+      - limit alone: the newest `limit` messages
+    Paginated responses add `has_more`: more messages lie in that direction.
+    """
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Authentication required'}), 401
     try:
-        conn = get_connection()
+        before_id, after_id, limit = _message_page_args()
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    try:
+        conn = get_db()
         cursor = conn.cursor()
+        # messages are append-only, so (count, max id) changes whenever the thread does
         cursor.execute(
-            """SELECT m.id, m.bike_id, m.sender_id, m.receiver_id, m.content, m.created_at,
-                      sender.name as sender_name, receiver.name as receiver_name
-               FROM messages m
-               JOIN users sender ON m.sender_id = sender.id
-               JOIN users receiver ON m.receiver_id = receiver.id
-               WHERE m.bike_id = %s AND (m.sender_id = %s OR m.receiver_id = %s)
-               ORDER BY m.created_at ASC""",
+            """SELECT COUNT(*), MAX(id) FROM messages
+               WHERE bike_id = %s AND (sender_id = %s OR receiver_id = %s)""",
             (bike_id, user_id, user_id)
         )
-        rows = cursor.fetchall()
-        messages = []
-        for row in rows:
-            created_val = row[5]
-            created_str = created_val.isoformat() if hasattr(created_val, 'isoformat') else str(created_val)
-            messages.append({
-                'id': row[0], 'bike_id': row[1], 'sender_id': row[2], 'receiver_id': row[3],
-                'content': row[4], 'created_at': created_str, 'sender_name': row[6], 'receiver_name': row[7],
-                'is_mine': row[2] == user_id
-            })
-        conn.close()
-        return jsonify({'messages': messages})
+        etag = _etag('messages', user_id, bike_id, before_id, after_id, limit, *cursor.fetchone())
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+        def message_to_dict(row):
+            message = _message_plan(row)
+            message['is_mine'] = row[2] == user_id
+            return message
+
+        where = ["m.bike_id = %s", "(m.sender_id = %s OR m.receiver_id = %s)"]
+        params = [bike_id, user_id, user_id]
+        if after_id is not None:
+            where.append("m.id > %s")
+            params.append(after_id)
+        if before_id is not None:
+            where.append("m.id < %s")
+            params.append(before_id)
+        sql = f"""SELECT m.id, m.bike_id, m.sender_id, m.receiver_id, m.content, m.created_at,
+                         sender.name as sender_name, receiver.name as receiver_name
+                  FROM messages m
+                  JOIN users sender ON m.sender_id = sender.id
+                  JOIN users receiver ON m.receiver_id = receiver.id
+                  WHERE {' AND '.join(where)}"""
+
+        if limit is not None:
+            # ids only grow: walk forward from after_id, otherwise back from the newest / before_id
+            backwards = after_id is None
+            cursor.execute(
+                sql + f" ORDER BY m.id {'DESC' if backwards else 'ASC'} LIMIT %s",
+                params + [limit + 1]
+            )
+            rows = cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if backwards:
+                rows.reverse()
+            messages = [message_to_dict(row) for row in rows]
+            return _conditional(json_response({'messages': messages, 'has_more': has_more}), etag)
+
+        stream = _stream_requested()
+        if stream:
+            cursor = server_side_cursor(conn)
+        cursor.execute(sql + " ORDER BY m.created_at ASC", params)
+        if stream:
+            return _stream_list('messages', cursor, message_to_dict, etag=etag)
+        messages = [message_to_dict(row) for row in cursor.fetchall()]
+        return _conditional(json_response({'messages': messages}), etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+_conversation_plan = RowPlan([
+    ('bike_id', None), ('bike_title', None), ('bike_image', None), ('other_user_id', None),
+    ('other_user_name', None), ('last_message', None), ('last_message_at', to_iso),
+])
+
+
 @data_bp.route('/api/messages/conversations', methods=['GET'])
 def get_conversations():
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Authentication required'}), 401
     try:
-        conn = get_connection()
+        conn = get_db()
         cursor = conn.cursor()
+        version = cache.catalog_version()
+        etag = None
+        if version is not None:
+            # new messages move (count, max message id); bike title/image edits move the catalogue version
+            cursor.execute(
+                "SELECT COUNT(*), MAX(last_message_id) FROM conversations WHERE user_low = %s OR user_high = %s",
+                (user_id, user_id)
+            )
+            etag = _etag('conversations', user_id, version, *cursor.fetchone())
+            not_modified = _not_modified(etag)
+            if not_modified:
+                return not_modified
+        # one summary row per (bike, user pair): two index range scans, no per-message subqueries
         cursor.execute(
-            """SELECT DISTINCT 
-                   m.bike_id,
-                   b.title as bike_title,
-                   b.image_url,
-                   CASE WHEN m.sender_id = %s THEN m.receiver_id ELSE m.sender_id END as other_user_id,
-                   u.name as other_user_name,
-                   (SELECT content FROM messages m2 
-                    WHERE m2.bike_id = m.bike_id 
-                      AND (m2.sender_id = %s OR m2.receiver_id = %s)
-                    ORDER BY m2.created_at DESC LIMIT 1) as last_message,
-                   (SELECT created_at FROM messages m2 
-                    WHERE m2.bike_id = m.bike_id 
-                      AND (m2.sender_id = %s OR m2.receiver_id = %s)
-                    ORDER BY m2.created_at DESC LIMIT 1) as last_message_at
-               FROM messages m
-               JOIN bikes b ON m.bike_id = b.id
-               JOIN users u ON CASE WHEN m.sender_id = %s THEN m.receiver_id ELSE m.sender_id END = u.id
-               WHERE m.sender_id = %s OR m.receiver_id = %s
-               ORDER BY last_message_at DESC""",
-            (user_id, user_id, user_id, user_id, user_id, user_id, user_id, user_id)
+            """SELECT c.bike_id,
+                      b.title AS bike_title,
+                      b.image_url,
+                      c.other_user_id,
+                      u.name AS other_user_name,
+                      c.last_message,
+                      c.last_message_at
+               FROM (SELECT bike_id, user_high AS other_user_id, last_message_id, last_message, last_message_at
+                       FROM conversations WHERE user_low = %s
+                     UNION ALL
+                     SELECT bike_id, user_low, last_message_id, last_message, last_message_at
+                       FROM conversations WHERE user_high = %s AND user_low <> %s) c
+               JOIN bikes b ON c.bike_id = b.id
+               JOIN users u ON c.other_user_id = u.id
+               ORDER BY c.last_message_at DESC, c.last_message_id DESC""",
+            (user_id, user_id, user_id)
         )
-        rows = cursor.fetchall()
-        conversations = []
-        for row in rows:
-            last_msg_at = row[6]
-            last_msg_str = last_msg_at.isoformat() if hasattr(last_msg_at, 'isoformat') else str(last_msg_at) if last_msg_at else None
-            conversations.append({
-                'bike_id': row[0],
-                'bike_title': row[1],
-                'bike_image': row[2],
-                'other_user_id': row[3],
-                'other_user_name': row[4],
-                'last_message': row[5],
-                'last_message_at': last_msg_str
-            })
-        conn.close()
-        return jsonify({'conversations': conversations})
+        conversations = _conversation_plan.many(cursor.fetchall())
+        response = json_response({'conversations': conversations})
+        return _conditional(response, etag or _etag(response.get_data()))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@data_bp.route('/api/recommendations/<int:bike_id>', methods=['GET'])
-def get_recommendations(bike_id):
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
+def _recommender():
+    # imported on the first recommendation request, not at worker boot:
+    # it pulls in NumPy, which the rest of the API never needs
+    import recommender
+    return recommender
 
-        # Get the target bike
-        cursor.execute(
-            "SELECT id, title, sale_price, rental_price, sale_type, model, bike_condition, location_name, latitude, longitude FROM bikes WHERE id = %s",
-            (bike_id,),
-        )
-        target = cursor.fetchone()
-        if not target:
-            return jsonify({'error': 'Bike not found'}), 404
 
-        # Get all bikes except the target
+def _catalog_changed(conn, bike_id, removed=False):
+    """After a bike write: bump the catalogue version and patch this worker's feature matrix."""
+    version = cache.bump_catalog_version(bike_id)
+    recommender = sys.modules.get('recommender')
+    if recommender is None:
+        return  # no recommendation served here yet, so no matrix to patch
+    if removed:
+        recommender.bike_removed(bike_id, version)
+    else:
+        recommender.bike_changed(conn, bike_id, version)
+
+
+def _recommendation_details(conn, similar_lists):
+    """
+    Attach listing fields to recommender (id, similarity) pairs with one
+    primary-key lookup for every id involved.
+    Returns: list of recommendation dicts per input list, same order.
+    """
+    ids = sorted({rec_id for similar in similar_lists for rec_id, _ in similar})
+    details = {}
+    if ids:
+        cursor = conn.cursor()
         cursor.execute(
-            "SELECT id, title, sale_price, rental_price, sale_type, model, bike_condition, location_name, latitude, longitude FROM bikes WHERE id != %s",
-            (bike_id,),
+            f"SELECT id, title, sale_price, rental_price, sale_type FROM bikes WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            tuple(ids),
         )
-        bikes = cursor.fetchall()
-        conn.close()
-
-        if not bikes:
-            return jsonify({'recommendations': []})
-
-        # Prepare features for ML
-        def encode_bike(bike):
-            price = bike[2] or bike[3] or 0  # sale_price or rental_price
-            sale_type_map = {'venta': 0, 'alquiler': 1, 'ambos': 2}
-            condition_map = {'Poor': 0, 'Fair': 1, 'Good': 2, 'Very Good': 3, 'Excellent': 4}
-            lat = bike[8]
-            lon = bike[9]
-            try:
-                price_val = float(price) if price else 0.0
-            except (TypeError, ValueError):
-                price_val = 0.0
-            try:
-                lat_val = float(lat) if lat is not None else 0.0
-            except (TypeError, ValueError):
-                lat_val = 0.0
-            try:
-                lon_val = float(lon) if lon is not None else 0.0
-            except (TypeError, ValueError):
-                lon_val = 0.0
-            return [
-                price_val / 1000.0 if price_val else 0,
-                sale_type_map.get(bike[4], 0),
-                condition_map.get(bike[6], 2),  # Default to Good
-                (lat_val / 90.0) if lat is not None else 0,
-                (lon_val / 180.0) if lon is not None else 0,
-            ]
-
-        target_features = encode_bike(target)
-        bike_features = [encode_bike(b) for b in bikes]
-
-        # Calculate similarities
-        similarities = cosine_similarity(np.array([target_features]), np.array(bike_features))[0]
-
-        # Get top 3 recommendations
-        top_indices = np.argsort(similarities)[-3:][::-1]
+        details = {row[0]: row for row in cursor.fetchall()}
+    out = []
+    for similar in similar_lists:
         recommendations = []
-        for idx in top_indices:
-            if similarities[idx] > 0.5:  # Threshold for relevance
-                bike = bikes[idx]
-                recommendations.append({
-                    'id': bike[0],
-                    'title': bike[1],
-                    'sale_price': bike[2],
-                    'rental_price': bike[3],
-                    'sale_type': bike[4],
-                    'similarity': float(similarities[idx])
-                })
+        for rec_id, similarity in similar:
+            bike = details.get(rec_id)
+            if bike is None:
+                continue  # deleted since the matrix was built
+            recommendations.append({
+                'id': bike[0],
+                'title': bike[1],
+                'sale_price': bike[2],
+                'rental_price': bike[3],
+                'sale_type': bike[4],
+                'similarity': similarity
+            })
+        out.append(recommendations)
+    return out
+
 
+@data_bp.route('/api/recommendations/<int:bike_id>', methods=['GET'])
+def get_recommendations(bike_id):
+    try:
+        conn = get_db()
+        # one dot product (or KD-tree lookup) against this worker's cached feature matrix
+        similar = _recommender().recommend(
+            conn, bike_id,
+            k=request.args.get('k', type=int),
+            threshold=request.args.get('threshold', type=float),
+        )
+        if similar is None:
+            return jsonify({'error': 'Bike not found'}), 404
+        recommendations, = _recommendation_details(conn, [similar])
         return jsonify({'recommendations': recommendations})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+MAX_BATCH_IDS = 100
+
+
+@data_bp.route('/api/recommendations/batch', methods=['POST'])
+def get_recommendations_batch():
+    """
+    Similar bikes for many listings at once.
+    Body: {"ids": [...], "k": optional int, "threshold": optional float}
+    Returns {"recommendations": {"<id>": [...]}, "missing": [ids not found]}.
+    """
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'error': 'ids must be a non-empty list'}), 400
+    if len(ids) > MAX_BATCH_IDS:
+        return jsonify({'error': f'at most {MAX_BATCH_IDS} ids per request'}), 400
+    try:
+        ids = list(dict.fromkeys(int(i) for i in ids))
+        k = payload.get('k')
+        k = int(k) if k is not None else None
+        threshold = payload.get('threshold')
+        threshold = float(threshold) if threshold is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ids and k must be integers, threshold a number'}), 400
+    try:
+        conn = get_db()
+        # every similarity row in one matrix product
+        similar = _recommender().recommend_many(conn, ids, k=k, threshold=threshold)
+        found = [i for i in ids if i in similar]
+        details = _recommendation_details(conn, [similar[i] for i in found])
+        return jsonify({
+            'recommendations': {str(i): recs for i, recs in zip(found, details)},
+            'missing': [i for i in ids if i not in similar],
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
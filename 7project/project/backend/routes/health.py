@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
-from db import get_connection
+from db import connection
 from redis_client import get_redis
+import cache
 from datetime import datetime
 
 health_bp = Blueprint('health', __name__)
@@ -8,8 +9,8 @@ health_bp = Blueprint('health', __name__)
 @health_bp.route('/health')
 def health():
     try:
-        conn = get_connection()
-        conn.close()
+        with connection():
+            pass
         db_status = 'healthy'
     except:
         db_status = 'unhealthy'
@@ -30,4 +31,16 @@ def health():
         'database': db_status,
         'cache': cache_status,
         'timestamp': datetime.now().isoformat() 
-    })
\ No newline at end of file
+    })
+
+
+@health_bp.route('/health/cache')
+def cache_health():
+    """Response-cache hit/miss counters (shared across workers via Redis)."""
+    try:
+        stats = cache.stats()
+    except Exception:
+        return jsonify({'status': 'unhealthy'}), 503
+    if stats is None:
+        return jsonify({'status': 'unconfigured'})
+    return jsonify({'status': 'healthy', **stats})
@@ -0,0 +1,153 @@
+"""Listing search: full-text index when the backend has one, LIKE otherwise.
+
+PostgreSQL uses the generated `bikes.search_tsv` column (GIN index) and
+MySQL the `ft_bikes_search` FULLTEXT index, both created by
+database/migrations.py. Anything else (or SEARCH_MODE=like) falls back to the
+old LIKE scan.
+"""
+import os
+import re
+
+from db import is_postgres
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# MySQL ignores words shorter than innodb_ft_min_token_size (3 by default)
+_MYSQL_MIN_TOKEN = 3
+
+# backend -> bool, probed once per worker
+_fts_ready = {}
+
+
+def _backend(conn):
+    if is_postgres(conn):
+        return 'postgres'
+    raw = getattr(conn, 'raw', conn)
+    if raw.__class__.__module__.startswith('mysql'):
+        return 'mysql'
+    return None
+
+
+def fts_available(conn) -> bool:
+    if os.getenv('SEARCH_MODE', '').lower() == 'like':
+        return False
+    backend = _backend(conn)
+    if backend is None:
+        return False
+    if backend not in _fts_ready:
+        cur = conn.cursor()
+        try:
+            if backend == 'postgres':
+                cur.execute(
+                    "SELECT 1 FROM information_schema.columns "
+                    "WHERE table_name = 'bikes' AND column_name = 'search_tsv'"
+                )
+                _fts_ready[backend] = cur.fetchone() is not None
+            else:
+                cur.execute("SHOW INDEX FROM bikes WHERE Key_name = 'ft_bikes_search'")
+                _fts_ready[backend] = bool(cur.fetchall())
+        except Exception:
+            conn.rollback()
+            return False
+    return _fts_ready[backend]
+
+
+def search_clause(conn, text):
+    """
+    Build the search predicate for the listing query.
+    Returns: (where_sql, where_params, rank_sql, rank_params). rank_sql is None
+    on the LIKE fallback, which has no relevance score.
+    """
+    tokens = [t.lower() for t in _TOKEN_RE.findall(text)]
+    like = f"%{text}%"
+    if tokens and fts_available(conn):
+        backend = _backend(conn)
+        if backend == 'postgres':
+            query = ' & '.join(f"{t}:*" for t in tokens)
+            match = "b.search_tsv @@ to_tsquery('simple', %s)"
+            rank = "ts_rank(b.search_tsv, to_tsquery('simple', %s))"
+            # owner name stays a substring match (idx_users_name_trgm when pg_trgm is
+            # installed); ANY(ARRAY(...)) lets the planner BitmapOr it with the GIN scan
+            owner = "b.owner_id = ANY(ARRAY(SELECT id FROM users WHERE name LIKE %s))"
+            return f"({match} OR {owner})", [query, like], rank, [query]
+        if all(len(t) >= _MYSQL_MIN_TOKEN for t in tokens):
+            query = ' '.join(f"+{t}*" for t in tokens)
+            match = "MATCH(b.title, b.model, b.description) AGAINST (%s IN BOOLEAN MODE)"
+            # MySQL cannot drive a FULLTEXT lookup from inside an OR, so the text and
+            # owner matches are separate UNION branches; the derived table makes MySQL
+            # materialize the ids once and join bikes on PRIMARY instead of re-running
+            # the union for every row
+            hits = """b.id IN (SELECT id FROM (
+                           SELECT id FROM bikes WHERE MATCH(title, model, description) AGAINST (%s IN BOOLEAN MODE)
+                           UNION
+                           SELECT b2.id FROM bikes b2 JOIN users u2 ON b2.owner_id = u2.id WHERE u2.name LIKE %s
+                       ) search_hits)"""
+            return hits, [query, like], match, [query]
+    return "(b.title LIKE %s OR b.description LIKE %s OR u.name LIKE %s)", [like, like, like], None, []
+
+
+_trgm_ready = {}
+
+
+def _trgm_available(conn) -> bool:
+    if 'postgres' not in _trgm_ready:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trgm_ready['postgres'] = cur.fetchone() is not None
+        except Exception:
+            conn.rollback()
+            return False
+    return _trgm_ready['postgres']
+
+
+def _like_escape(text):
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def suggest(conn, q, limit):
+    """
+    Typeahead matches for `q` among bike titles and models.
+    Uses the pg_trgm GiST indexes (substring match, nearest first) on
+    PostgreSQL and the title/model prefix indexes otherwise: lower(...)
+    text_pattern_ops on PostgreSQL, whose LIKE is case-sensitive, and the
+    plain columns under MySQL's case-insensitive collation.
+    Returns: up to `limit` dicts {'value', 'field'}, deduplicated.
+    """
+    needle = q.lower()
+    # fetch a few extra rows per field: many bikes share the same title
+    per_field = limit * 3
+    cur = conn.cursor()
+    if is_postgres(conn) and _trgm_available(conn):
+        pattern = f"%{_like_escape(needle)}%"
+        cur.execute(
+            """(SELECT title, 'title', lower(title) <-> %s AS dist FROM bikes
+                WHERE lower(title) LIKE %s ESCAPE '!' ORDER BY dist LIMIT %s)
+               UNION ALL
+               (SELECT model, 'model', lower(model) <-> %s AS dist FROM bikes
+                WHERE lower(model) LIKE %s ESCAPE '!' ORDER BY dist LIMIT %s)""",
+            (needle, pattern, per_field, needle, pattern, per_field),
+        )
+        # merge both fields, closest first
+        rows = [(value, field) for value, field, _ in sorted(cur.fetchall(), key=lambda r: r[2])]
+    else:
+        pg = is_postgres(conn)
+        pattern = f"{_like_escape(needle if pg else q)}%"
+        rows = []
+        for field in ('title', 'model'):
+            column = f"lower({field})" if pg else field
+            cur.execute(
+                f"SELECT DISTINCT {field}, '{field}' FROM bikes WHERE {column} LIKE %s ESCAPE '!' ORDER BY {field} LIMIT %s",
+                (pattern, per_field),
+            )
+            rows.extend(cur.fetchall())
+    seen = set()
+    out = []
+    for value, field in rows:
+        key = (value or '').strip().lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        out.append({'value': value, 'field': field})
+        if len(out) >= limit:
+            break
+    return out
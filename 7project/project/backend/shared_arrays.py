@@ -0,0 +1,80 @@
+"""Memory-mapped NumPy snapshots shared by the workers of one host.
+
+publish() writes a set of arrays as .npy files plus meta.json into a new
+directory under `root`, then repoints the `current` symlink with an atomic
+rename, so readers see the old snapshot or the new one, never half of one.
+Readers map the files (np.load(mmap_mode=...)) instead of reading them, so
+every worker uses the same page-cache pages and memory does not grow with
+the number of workers. build_lock() makes sure only one process rebuilds.
+"""
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+CURRENT = 'current'
+LOCK = 'build.lock'
+_PREFIX = 'snapshot-'
+
+
+def publish(root, arrays, meta):
+    """Write a snapshot and make it current. Returns its directory."""
+    os.makedirs(root, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=_PREFIX, dir=root)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), array)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    previous = current_path(root)
+    link = os.path.join(root, f'{CURRENT}.{os.getpid()}')
+    os.symlink(os.path.basename(path), link)
+    os.replace(link, os.path.join(root, CURRENT))
+    # keep the previous snapshot for readers that resolved the link just
+    # before the swap; anything older is unlinked (mapped pages stay valid)
+    keep = {os.path.basename(path), os.path.basename(previous or '')}
+    for name in os.listdir(root):
+        if name.startswith(_PREFIX) and name not in keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return os.path.realpath(path)
+
+
+def current_path(root):
+    """Directory of the current snapshot, or None when nothing was published yet."""
+    link = os.path.join(root, CURRENT)
+    return os.path.realpath(link) if os.path.islink(link) else None
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load(path, name, mode='r'):
+    """Map one array of a snapshot; mode 'c' gives a private copy-on-write view."""
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode=mode)
+
+
+@contextmanager
+def build_lock(root, blocking=True):
+    """
+    Exclusive lock for rebuilding the snapshot under root. Yields True when
+    held; with blocking=False, yields False if another process holds it.
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
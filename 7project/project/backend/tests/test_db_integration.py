@@ -70,6 +70,7 @@ def _init_schema(conn):
         image_url TEXT,
         owner_id INTEGER,
         created_at TEXT,
+        updated_at TEXT,
         location_name TEXT,
         latitude REAL,
         longitude REAL
@@ -8,6 +8,7 @@ Type: integration test (application + persistence).
 """
 
 import os
+import json
 import sqlite3
 from http import cookies
 
@@ -31,6 +32,16 @@ class _SqliteCompatCursor:
     def fetchall(self):
         return self._cur.fetchall()
 
+    def fetchmany(self, size):
+        return self._cur.fetchmany(size)
+
+    def executemany(self, sql, seq):
+        self._cur.executemany(sql.replace('%s', '?'), seq)
+        return self
+
+    def close(self):
+        return self._cur.close()
+
     @property
     def lastrowid(self):
         return self._cur.lastrowid
@@ -40,6 +51,8 @@ class SqliteCompatConn:
     def __init__(self):
         self.conn = sqlite3.connect(':memory:')
         self.conn.row_factory = sqlite3.Row
+        # PostgreSQL/MySQL scalar used by the radius search SQL
+        self.conn.create_function('LEAST', -1, lambda *args: min(args))
 
     def cursor(self):
         return _SqliteCompatCursor(self.conn)
@@ -69,6 +82,7 @@ def _init_schema(conn):
         image_url TEXT,
         owner_id INTEGER,
         created_at TEXT,
+        updated_at TEXT,
         location_name TEXT,
         latitude REAL,
         longitude REAL
@@ -85,7 +99,8 @@ def _get_cookiejar_from_resp(resp):
     return {k: v.value for k, v in simple.items()}
 
 
-def test_signup_and_create_bike(monkeypatch):
+def _make_client(monkeypatch):
+    """Import the app against stubbed drivers and a shared sqlite connection."""
     os.environ['MIGRATE_ON_START'] = 'false'
 
     import types, sys
@@ -136,10 +151,17 @@ def test_signup_and_create_bike(monkeypatch):
         return _shared_conn
 
     monkeypatch.setattr(dbmod, 'get_connection', _fake_conn)
+    # per-worker caches must not leak between tests' databases
+    import recommender
+    recommender.reset()
 
     from app import app as flask_app
 
-    client = flask_app.test_client()
+    return flask_app.test_client(), _shared_conn
+
+
+def test_signup_and_create_bike(monkeypatch):
+    client, _ = _make_client(monkeypatch)
 
     import uuid
     uname = f"testuser_{uuid.uuid4().hex[:8]}"
@@ -159,3 +181,400 @@ def test_signup_and_create_bike(monkeypatch):
     j = resp3.get_json()
     assert 'bikes' in j
     assert j['count'] >= 1
+
+
+def test_bikes_keyset_pagination(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for i in range(5):
+        cur.execute(
+            'INSERT INTO bikes (title, sale_type, created_at) VALUES (%s, %s, %s)',
+            (f'Bike {i}', 'venta', f'2024-01-0{i + 1} 10:00:00'),
+        )
+    conn.commit()
+
+    seen = []
+    after = None
+    for _ in range(5):
+        url = '/api/bikes?limit=2' + (f'&after={after}' if after else '')
+        j = client.get(url).get_json()
+        seen.extend(b['title'] for b in j['bikes'])
+        after = j['next_cursor']
+        if not after:
+            break
+    assert seen == ['Bike 4', 'Bike 3', 'Bike 2', 'Bike 1', 'Bike 0']
+
+    assert client.get('/api/bikes?after=not-a-cursor').status_code == 400
+
+
+def test_bike_suggestions(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for title, model in (('Trek mountain bike', 'Trek Marlin 5'), ('Trek road', 'Trek Domane'), ('City bike', 'Btwin')):
+        cur.execute('INSERT INTO bikes (title, model, sale_type) VALUES (%s, %s, %s)', (title, model, 'venta'))
+    conn.commit()
+
+    j = client.get('/api/bikes/suggest?q=tre').get_json()
+    values = [s['value'] for s in j['suggestions']]
+    assert 'Trek mountain bike' in values and 'Trek Marlin 5' in values
+    assert 'City bike' not in values
+    assert client.get('/api/bikes/suggest?q=t').get_json() == {'suggestions': []}
+
+
+def test_bike_list_etag_revalidation(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO bikes (title, sale_type) VALUES (%s, %s)', ('Etag bike', 'venta'))
+    conn.commit()
+
+    first = client.get('/api/bikes')
+    etag = first.headers.get('ETag')
+    assert first.status_code == 200 and etag
+    again = client.get('/api/bikes', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+    cur.execute('INSERT INTO bikes (title, sale_type) VALUES (%s, %s)', ('Another bike', 'venta'))
+    conn.commit()
+    assert client.get('/api/bikes', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_bike_list_etag_without_redis_skips_listing_query(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO bikes (title, sale_type) VALUES (%s, %s)', ('Marker bike', 'venta'))
+    conn.commit()
+    etag = client.get('/api/bikes').headers.get('ETag')
+
+    import routes.data as data
+    projection = data._projection
+    def _listing_query_ran(*args, **kwargs):
+        raise AssertionError('listing query built for a 304')
+    monkeypatch.setattr(data, '_projection', _listing_query_ran)
+    assert client.get('/api/bikes', headers={'If-None-Match': etag}).status_code == 304
+    monkeypatch.setattr(data, '_projection', projection)
+
+    # an edit keeps COUNT(*) and MAX(id) but moves MAX(updated_at)
+    cur.execute('UPDATE bikes SET title = %s, updated_at = %s WHERE id = 1', ('Edited', '2030-01-01 00:00:00'))
+    conn.commit()
+    assert client.get('/api/bikes', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_bike_list_cache_key_keeps_inner_whitespace(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO bikes (title, sale_type) VALUES (%s, %s)', ('red bike', 'venta'))
+    conn.commit()
+
+    # a dict standing in for the Redis response cache
+    import routes.data as data
+    store = {}
+    monkeypatch.setattr(data.cache, 'catalog_version', lambda: 1)
+    monkeypatch.setattr(data.cache, 'get', store.get)
+    monkeypatch.setattr(data.cache, 'put', lambda key, body, ttl=None: store.__setitem__(key, body))
+
+    first = client.get('/api/bikes?search=red+bike')
+    assert first.headers['X-Cache'] == 'MISS' and first.get_json()['count'] == 1
+    # two spaces match nothing, so they must not share the first response's key/ETag
+    second = client.get('/api/bikes?search=red++bike', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200 and second.headers['X-Cache'] == 'MISS'
+    assert second.get_json()['count'] == 0
+    assert client.get('/api/bikes?search=+red+bike+').headers['X-Cache'] == 'HIT'
+
+
+def test_get_single_bike(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO users (name) VALUES (%s)', ('owner1',))
+    cur.execute('INSERT INTO bikes (title, sale_type, sale_price, owner_id) VALUES (%s, %s, %s, %s)', ('Solo', 'venta', 120, 1))
+    conn.commit()
+
+    resp = client.get('/api/bikes/1')
+    assert resp.status_code == 200
+    bike = resp.get_json()['bike']
+    assert bike['title'] == 'Solo' and bike['owner_name'] == 'owner1'
+    assert resp.headers.get('ETag')
+    assert client.get('/api/bikes/999').status_code == 404
+
+
+def test_bikes_owner_filter(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for title, owner in (('A1', 1), ('B1', 2), ('A2', 1)):
+        cur.execute('INSERT INTO bikes (title, sale_type, owner_id) VALUES (%s, %s, %s)', (title, 'venta', owner))
+    conn.commit()
+
+    j = client.get('/api/bikes?owner=1').get_json()
+    assert sorted(b['title'] for b in j['bikes']) == ['A1', 'A2']
+    # a malformed owner is an error, never the whole catalogue
+    for url in ('/api/bikes?owner=abc', '/api/bikes?owner=NaN', '/api/bikes/facets?owner=1.5'):
+        assert client.get(url).status_code == 400
+
+
+def test_bikes_sparse_fieldsets(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('INSERT INTO bikes (title, sale_type, description) VALUES (%s, %s, %s)', ('Long', 'venta', 'x' * 1000))
+    conn.commit()
+
+    card = client.get('/api/bikes').get_json()['bikes'][0]
+    # a cut-down description never travels under the real column name
+    assert 'description' not in card
+    assert card['snippet'] == 'x' * 160
+    full = client.get('/api/bikes?fields=full').get_json()['bikes'][0]
+    assert len(full['description']) == 1000 and 'snippet' not in full
+    narrow = client.get('/api/bikes?fields=title,sale_price').get_json()['bikes'][0]
+    assert set(narrow) == {'id', 'title', 'sale_price'}
+    assert client.get('/api/bikes?fields=nope').status_code == 400
+
+
+def test_bikes_streaming_matches_buffered(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for i in range(7):
+        cur.execute('INSERT INTO bikes (title, sale_type, created_at) VALUES (%s, %s, %s)',
+                    (f'S{i}', 'venta', f'2024-02-0{i + 1} 09:00:00'))
+    conn.commit()
+
+    buffered = client.get('/api/bikes?limit=5').get_json()
+    streamed = client.get('/api/bikes?limit=5&stream=1')
+    assert streamed.status_code == 200
+    j = json.loads(streamed.get_data())
+    assert j['bikes'] == buffered['bikes']
+    assert j['count'] == 5
+    assert j['next_cursor'] == buffered['next_cursor']
+
+
+def test_bikes_near_radius_sorted_by_distance(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    # Stavanger centre, Sandnes (~13 km), Bergen (~160 km), and one without a location
+    for title, lat, lon in [('Sandnes', 58.852, 5.736), ('Centre', 58.970, 5.733),
+                            ('Bergen', 60.391, 5.322), ('Nowhere', None, None)]:
+        cur.execute('INSERT INTO bikes (title, sale_type, latitude, longitude) VALUES (%s, %s, %s, %s)',
+                    (title, 'venta', lat, lon))
+    conn.commit()
+
+    j = client.get('/api/bikes?near=58.97,5.73&radius_km=20').get_json()
+    assert [b['title'] for b in j['bikes']] == ['Centre', 'Sandnes']
+    assert j['bikes'][0]['distance_km'] < j['bikes'][1]['distance_km'] < 20
+
+    first = client.get('/api/bikes?near=58.97,5.73&radius_km=200&limit=2').get_json()
+    assert [b['title'] for b in first['bikes']] == ['Centre', 'Sandnes']
+    rest = client.get(f"/api/bikes?near=58.97,5.73&radius_km=200&limit=2&after={first['next_cursor']}").get_json()
+    assert [b['title'] for b in rest['bikes']] == ['Bergen']
+
+    newest = client.get('/api/bikes?near=58.97,5.73&radius_km=20&sort=newest').get_json()
+    assert {b['title'] for b in newest['bikes']} == {'Centre', 'Sandnes'}
+    assert client.get('/api/bikes?near=abc').status_code == 400
+    assert client.get('/api/bikes?sort=distance').status_code == 400
+
+
+def test_bike_clusters_grid(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    # three bikes in Stavanger, one in Bergen, one rental in Bergen
+    for title, sale_type, lat, lon in [('A', 'venta', 58.970, 5.733), ('B', 'venta', 58.971, 5.735),
+                                       ('C', 'venta', 58.969, 5.731), ('D', 'venta', 60.391, 5.322),
+                                       ('E', 'alquiler', 60.392, 5.323)]:
+        cur.execute('INSERT INTO bikes (title, sale_type, latitude, longitude) VALUES (%s, %s, %s, %s)',
+                    (title, sale_type, lat, lon))
+    conn.commit()
+
+    j = client.get('/api/bikes/clusters?bbox=4,58,7,61&zoom=6').get_json()
+    assert j['total'] == 5
+    assert sorted(c['count'] for c in j['clusters']) == [2, 3]
+    stavanger = next(c for c in j['clusters'] if c['count'] == 3)
+    assert abs(stavanger['lat'] - 58.97) < 0.01
+
+    venta = client.get('/api/bikes/clusters?bbox=4,58,7,61&zoom=6&type=venta').get_json()
+    bergen = next(c for c in venta['clusters'] if c['lat'] > 60)
+    assert bergen['count'] == 1 and 'bike_id' in bergen
+
+    assert client.get('/api/bikes/clusters?bbox=4,58,7&zoom=6').status_code == 400
+    assert client.get('/api/bikes/clusters?bbox=-180,-90,180,90&zoom=12').status_code == 400
+
+
+def test_bike_facets(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for title, sale_type, sale, rent, condition in [('A', 'venta', 80, None, 'Good'),
+                                                    ('B', 'venta', 300, None, 'New'),
+                                                    ('C', 'ambos', 600, 90, 'Good'),
+                                                    ('D', 'alquiler', None, 30, None)]:
+        cur.execute('INSERT INTO bikes (title, sale_type, sale_price, rental_price, bike_condition) '
+                    'VALUES (%s, %s, %s, %s, %s)', (title, sale_type, sale, rent, condition))
+    conn.commit()
+
+    j = client.get('/api/bikes/facets').get_json()
+    assert j['total'] == 4
+    assert j['sale_type'] == {'venta': 2, 'alquiler': 1, 'ambos': 1}
+    assert j['condition'] == [{'value': 'Good', 'count': 2}, {'value': 'New', 'count': 1}]
+    sale = {bucket['min']: bucket['count'] for bucket in j['sale_price']}
+    assert (sale[0], sale[250], sale[500]) == (1, 1, 1)
+    rental = {bucket['min']: bucket['count'] for bucket in j['rental_price']}
+    assert (rental[25], rental[50]) == (1, 1)
+    assert j['sale_price'][-1]['max'] is None
+
+    filtered = client.get('/api/bikes/facets?type=venta').get_json()
+    assert filtered['total'] == 3
+    assert filtered['sale_type']['alquiler'] == 0
+
+
+def test_recommendations_follow_bike_writes(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for title, price, condition in [('Target', 300, 'Good'), ('Twin', 310, 'Good'), ('Cheap', 20, 'Poor')]:
+        cur.execute('INSERT INTO bikes (title, sale_price, sale_type, bike_condition) VALUES (%s, %s, %s, %s)',
+                    (title, price, 'venta', condition))
+    conn.commit()
+
+    recs = client.get('/api/recommendations/1').get_json()['recommendations']
+    assert recs[0]['title'] == 'Twin'
+    assert all(r['id'] != 1 for r in recs)
+    assert client.get('/api/recommendations/999').status_code == 404
+
+    # a bike published after the matrix was built is picked up incrementally
+    client.post('/api/signup', json={'name': 'recs_user', 'password': 'pw'})
+    # same title too, so both the numeric and the text channel see a twin
+    resp = client.post('/api/bikes', json={'title': 'Target', 'sale_price': 300, 'sale_type': 'venta', 'condition': 'Good'})
+    assert resp.status_code == 201
+    recs = client.get('/api/recommendations/1').get_json()['recommendations']
+    assert recs[0]['id'] == 4
+    assert recs[0]['similarity'] > 0.999
+
+
+def test_batch_recommendations(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for title, price, condition in [('A', 300, 'Good'), ('A2', 305, 'Good'), ('B', 2000, 'Excellent'), ('B2', 2050, 'Excellent')]:
+        cur.execute('INSERT INTO bikes (title, sale_price, sale_type, bike_condition) VALUES (%s, %s, %s, %s)',
+                    (title, price, 'venta', condition))
+    conn.commit()
+
+    resp = client.post('/api/recommendations/batch', json={'ids': [1, 3, 99], 'k': 1})
+    assert resp.status_code == 200
+    j = resp.get_json()
+    assert j['missing'] == [99]
+    assert [r['title'] for r in j['recommendations']['1']] == ['A2']
+    assert [r['title'] for r in j['recommendations']['3']] == ['B2']
+    single = client.get('/api/recommendations/1?k=1').get_json()['recommendations']
+    assert [r['id'] for r in single] == [r['id'] for r in j['recommendations']['1']]
+
+    assert client.post('/api/recommendations/batch', json={'ids': []}).status_code == 400
+    assert client.post('/api/recommendations/batch', json={'ids': ['x']}).status_code == 400
+
+
+def test_recommendations_served_from_offline_table(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE bike_recommendations (bike_id INTEGER, rec_rank INTEGER, recommended_id INTEGER, '
+                'similarity REAL, PRIMARY KEY (bike_id, rec_rank))')
+    cur.execute('CREATE TABLE bike_recommendation_runs (id INTEGER PRIMARY KEY AUTOINCREMENT, finished_at TEXT, '
+                'max_bike_id INTEGER, k INTEGER, threshold REAL)')
+    for title, price in [('A', 300), ('A2', 305), ('B', 2000)]:
+        cur.execute('INSERT INTO bikes (title, sale_price, sale_type, bike_condition) VALUES (%s, %s, %s, %s)',
+                    (title, price, 'venta', 'Good'))
+    conn.commit()
+
+    from database.build_recommendations import build
+    bikes, written = build(conn, k=3, threshold=0.5, batch_size=2)
+    assert bikes == 3 and written > 0
+
+    # mark a stored row so we can tell the table answered, not the live matrix
+    cur.execute('UPDATE bike_recommendations SET similarity = 0.777 WHERE bike_id = 1 AND rec_rank = 0')
+    conn.commit()
+    recs = client.get('/api/recommendations/1').get_json()['recommendations']
+    assert recs[0]['title'] == 'A2' and recs[0]['similarity'] == 0.777
+
+    # bikes newer than the run, and larger k than stored, are computed live
+    cur.execute('INSERT INTO bikes (title, sale_price, sale_type, bike_condition) VALUES (%s, %s, %s, %s)',
+                ('A3', 302, 'venta', 'Good'))
+    conn.commit()
+    assert client.get('/api/recommendations/4').get_json()['recommendations'][0]['title'] in ('A', 'A2')
+    live = client.get('/api/recommendations/1?k=4').get_json()['recommendations']
+    assert all(r['similarity'] != 0.777 for r in live)
+
+
+def test_recommendations_from_shared_snapshot(monkeypatch, tmp_path):
+    monkeypatch.setenv('RECOMMENDER_SHARED_DIR', str(tmp_path))
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    for title, price in [('Target', 300), ('Twin', 310), ('Far', 4000)]:
+        cur.execute('INSERT INTO bikes (title, sale_price, sale_type, bike_condition) VALUES (%s, %s, %s, %s)',
+                    (title, price, 'venta', 'Good'))
+    conn.commit()
+    first = client.get('/api/recommendations/1').get_json()['recommendations']
+    assert first[0]['title'] == 'Twin'
+
+    # a second worker maps the published snapshot instead of reading the table
+    import recommender
+    recommender.reset()
+
+    def _no_rebuild(conn):
+        raise AssertionError('snapshot should have been reused')
+    monkeypatch.setattr(recommender, 'build_index', _no_rebuild)
+    assert client.get('/api/recommendations/1').get_json()['recommendations'] == first
+
+
+def test_conversations_summary_follows_send_message(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, bike_id INTEGER, sender_id INTEGER, '
+                'receiver_id INTEGER, content TEXT, created_at TEXT)')
+    cur.execute('CREATE TABLE conversations (bike_id INTEGER, user_low INTEGER, user_high INTEGER, last_message_id INTEGER, '
+                'last_message TEXT, last_message_at TEXT, PRIMARY KEY (bike_id, user_low, user_high))')
+    cur.execute("INSERT INTO bikes (title, sale_type) VALUES ('Road bike', 'venta')")
+    conn.commit()
+    client.post('/api/signup', json={'name': 'seller', 'password': 'pw'})
+    client.post('/api/signup', json={'name': 'buyer', 'password': 'pw'})  # session is now the buyer (id 2)
+    # sqlite speaks PostgreSQL's upsert (ON CONFLICT ... DO UPDATE ... WHERE), not MySQL's
+    import routes.data as data
+    monkeypatch.setattr(data, 'is_postgres', lambda conn: True)
+
+    for content in ('Is it available?', 'Still there?'):
+        resp = client.post('/api/messages', json={'bike_id': 1, 'receiver_id': 1, 'content': content})
+        assert resp.status_code == 201
+    convs = client.get('/api/messages/conversations').get_json()['conversations']
+    assert [(c['bike_id'], c['other_user_id'], c['other_user_name'], c['last_message']) for c in convs] == \
+        [(1, 1, 'seller', 'Still there?')]
+
+    # a late upsert for an older message never moves the summary backwards
+    data._touch_conversation(conn, conn.cursor(), 1, 1, 2, 1, 'Is it available?', '2000-01-01 00:00:00')
+    conn.commit()
+    assert client.get('/api/messages/conversations').get_json()['conversations'][0]['last_message'] == 'Still there?'
+
+    # with a catalogue version the ETag comes from the (count, max message id) marker
+    monkeypatch.setattr(data.cache, 'catalog_version', lambda: 1)
+    etag = client.get('/api/messages/conversations').headers['ETag']
+    assert client.get('/api/messages/conversations', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/api/messages', json={'bike_id': 1, 'receiver_id': 1, 'content': 'Hello?'})
+    assert client.get('/api/messages/conversations', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_bike_messages_cursor_pagination(monkeypatch):
+    client, conn = _make_client(monkeypatch)
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, bike_id INTEGER, sender_id INTEGER, '
+                'receiver_id INTEGER, content TEXT, created_at TEXT)')
+    cur.execute("INSERT INTO bikes (title, sale_type) VALUES ('Road bike', 'venta')")
+    conn.commit()
+    client.post('/api/signup', json={'name': 'seller', 'password': 'pw'})
+    client.post('/api/signup', json={'name': 'buyer', 'password': 'pw'})  # session is the buyer (id 2)
+    for n in range(1, 8):
+        sender, receiver = (2, 1) if n % 2 else (1, 2)
+        cur.execute('INSERT INTO messages (bike_id, sender_id, receiver_id, content, created_at) VALUES (%s, %s, %s, %s, %s)',
+                    (1, sender, receiver, f'm{n}', f'2024-01-01 00:00:0{n}'))
+    conn.commit()
+
+    def page(query):
+        j = client.get(f'/api/messages/bike/1?{query}').get_json()
+        return [m['content'] for m in j['messages']], j.get('has_more')
+
+    assert page('')[0] == [f'm{n}' for n in range(1, 8)]  # legacy full thread, no has_more
+    assert page('limit=3') == (['m5', 'm6', 'm7'], True)
+    assert page('before_id=5&limit=3') == (['m2', 'm3', 'm4'], True)
+    assert page('before_id=2&limit=3') == (['m1'], False)
+    assert page('after_id=4&limit=2') == (['m5', 'm6'], True)
+    assert page('after_id=7') == ([], False)
+    assert client.get('/api/messages/bike/1?after_id=x').status_code == 400
@@ -0,0 +1,129 @@
+"""
+Unit test: Redis response cache helpers
+
+Runs cache.py against a tiny in-memory stand-in for the Redis client:
+canonical keys, version-based invalidation and hit/miss counters.
+Type: unit test. No network or real Redis required.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import types
+redis_mod = types.ModuleType('redis')
+redis_mod.from_url = lambda url: None
+redis_mod.Redis = lambda *a, **k: None
+sys.modules.setdefault('redis', redis_mod)
+
+import cache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.round_trips = 0
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+    def hincrby(self, name, field, amount):
+        h = self.hashes.setdefault(name, {})
+        h[field.encode()] = h.get(field.encode(), 0) + amount
+
+    def hgetall(self, name):
+        return self.hashes.get(name, {})
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them on execute(), like redis-py's Pipeline."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        return lambda *a, **k: self.calls.append((method, a, k))
+
+    def execute(self):
+        self.redis.round_trips += 1
+        results = [method(*a, **k) for method, a, k in self.calls]
+        self.calls = []
+        return results
+
+
+def test_make_key_is_canonical():
+    a = cache.make_key('bikes', {'type': ['venta'], 'search': ['trek']}, 3)
+    b = cache.make_key('bikes', {'search': ['trek'], 'type': ['venta']}, 3)
+    assert a == b
+    assert a.startswith('bikes:v3:')
+    assert a != cache.make_key('bikes', {'type': ['venta'], 'search': ['trek']}, 4)
+
+
+def test_version_bump_and_stats(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, '_client', redis)
+    v0 = cache.catalog_version()
+    key = cache.make_key('bikes', {}, v0)
+    assert cache.get(key) is None
+    cache.put(key, b'{"bikes": []}')
+    redis.round_trips = 0
+    assert cache.get(key) == b'{"bikes": []}'
+    # the lookup and its stats counter share one round trip
+    assert redis.round_trips == 1
+
+    cache.bump_catalog_version()
+    assert cache.catalog_version() == v0 + 1
+
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    assert stats['hit_ratio'] == 0.5
+
+
+def test_catalog_changes_replay_and_gaps(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, '_client', redis)
+    for bike_id in (7, 8, 7):
+        cache.bump_catalog_version(bike_id)
+    assert cache.catalog_changes(0, 3) == ([7, 8, 7], 3)
+    assert cache.catalog_changes(3, 3) == ([], 3)
+
+    # a writer between INCR and logging: the tail is not there yet
+    redis.incr(cache.CATALOG_VERSION_KEY)
+    assert cache.catalog_changes(1, 4) == ([8, 7], 3)
+    # a lost entry before a logged one can never be replayed
+    cache.bump_catalog_version(9)
+    assert cache.catalog_changes(1, 5) is None
+    redis.delete(f'{cache.CHANGE_KEY_PREFIX}2')
+    assert cache.catalog_changes(0, 3) is None
+    # Redis reset below what the reader has, or too long a run
+    assert cache.catalog_changes(5, 2) is None
+    assert cache.catalog_changes(0, cache.MAX_REPLAY + 1) is None
+
+
+def test_cache_disabled_without_redis(monkeypatch):
+    monkeypatch.setattr(cache, '_client', None)
+    assert cache.catalog_version() is None
+    assert cache.get('anything') is None
+    cache.bump_catalog_version()
+    assert cache.stats() is None
+    assert cache.catalog_changes(0, 1) is None
@@ -0,0 +1,107 @@
+"""
+Unit test: db connection pool
+
+Exercises db.ConnectionPool with fake connections: reuse of idle connections,
+pre-ping eviction of dead ones and the checkout timeout.
+Type: unit test. No network or real DB required.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+# light stubs for mysql and psycopg2 so importing db works in tests
+import types
+mysql_mod = types.ModuleType('mysql')
+mysql_connector = types.ModuleType('mysql.connector')
+mysql_connector.connect = lambda **kwargs: None
+mysql_mod.connector = mysql_connector
+sys.modules.setdefault('mysql', mysql_mod)
+sys.modules.setdefault('mysql.connector', mysql_connector)
+psycopg2_mod = types.ModuleType('psycopg2')
+psycopg2_mod.connect = lambda *a, **k: None
+sys.modules.setdefault('psycopg2', psycopg2_mod)
+
+import db
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.dead:
+            raise RuntimeError('server closed the connection')
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.dead = False
+        self.closed = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def _pool(**kwargs):
+    created = []
+
+    def _connect():
+        conn = FakeConn()
+        created.append(conn)
+        return conn
+    return db.ConnectionPool(_connect, **kwargs), created
+
+
+def test_pool_reuses_idle_connection():
+    pool, created = _pool(max_size=2)
+    conn = pool.acquire()
+    conn.close()
+    conn2 = pool.acquire()
+    assert conn2.raw is created[0]
+    assert len(created) == 1
+    # returning a connection rolls back any open transaction
+    assert created[0].rollbacks >= 1
+    conn2.close()
+
+
+def test_pool_pre_ping_replaces_dead_connection():
+    pool, created = _pool(max_size=2)
+    pool.acquire().close()
+    created[0].dead = True
+    conn = pool.acquire()
+    assert conn.raw is created[1]
+    assert created[0].closed
+
+
+def test_pool_checkout_timeout():
+    pool, _ = _pool(max_size=1, timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(db.PoolTimeout):
+        pool.acquire()
+    held.close()
+    pool.acquire().close()
+
+
+def test_is_postgres_unwraps_pooled_connection():
+    PG = type('PGConn', (), {'__module__': 'psycopg2.extensions', 'rollback': lambda self: None})
+    pool = db.ConnectionPool(PG, max_size=1)
+    conn = pool.acquire()
+    assert db.is_postgres(conn) is True
+    conn.close()
@@ -0,0 +1,52 @@
+"""
+Unit test: radius search helpers
+
+Checks geo.parse_near validation and that geo.bounding_box always contains
+the search circle, including across the antimeridian and near the poles.
+Type: unit test (pure functions). No network or real DB required.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import geo
+
+
+def test_parse_near_defaults_and_clamps():
+    assert geo.parse_near('58.97, 5.73') == (58.97, 5.73, geo.DEFAULT_RADIUS_KM)
+    assert geo.parse_near('0,0', '99999')[2] == geo.MAX_RADIUS_KM
+    for raw, radius in [('58.97', None), ('91,0', None), ('a,b', None), ('0,0', '-1'), ('0,0', 'far')]:
+        with pytest.raises(ValueError):
+            geo.parse_near(raw, radius)
+
+
+def test_bounding_box_contains_circle():
+    lat, lon, radius = 58.97, 5.73, 50
+    min_lat, max_lat, lon_ranges = geo.bounding_box(lat, lon, radius)
+    (min_lon, max_lon), = lon_ranges
+    # points on the circle due N/S/E/W all fall inside the box
+    assert geo.haversine_km(lat, lon, max_lat, lon) == pytest.approx(radius)
+    assert geo.haversine_km(lat, lon, min_lat, lon) == pytest.approx(radius)
+    assert geo.haversine_km(lat, lon, lat, max_lon) >= radius
+    assert geo.haversine_km(lat, lon, lat, min_lon) >= radius
+
+
+def test_bounding_box_antimeridian_and_pole():
+    _, _, lon_ranges = geo.bounding_box(0, 179.9, 50)
+    assert len(lon_ranges) == 2
+    assert lon_ranges[0][1] == 180.0 and lon_ranges[1][0] == -180.0
+    _, max_lat, lon_ranges = geo.bounding_box(89.9, 0, 50)
+    assert max_lat == 90.0 and lon_ranges == []
+
+
+def test_snap_bbox_is_stable_across_small_pans():
+    cell = geo.cell_size(10)
+    a = geo.snap_bbox((5.700, 58.950, 5.760, 58.990), cell)
+    b = geo.snap_bbox((5.701, 58.951, 5.761, 58.991), cell)
+    assert a == b
+    with pytest.raises(ValueError):
+        geo.snap_bbox((-180, -85, 180, 85), geo.cell_size(10))
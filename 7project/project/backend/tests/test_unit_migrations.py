@@ -47,3 +47,72 @@ def test_is_postgres_true():
 def test_is_postgres_false():
     conn = DummyMySQL()
     assert _is_postgres_connection(conn) is False
+
+
+class _RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(' '.join(sql.split()))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+
+def _run_ensure_schema(monkeypatch, module_name):
+    import database.migrations as migrations
+
+    cur = _RecordingCursor()
+    conn_cls = type('Conn', (), {
+        '__module__': module_name,
+        'cursor': lambda self: cur,
+        'commit': lambda self: None,
+        'close': lambda self: None,
+    })
+    monkeypatch.setattr(migrations, 'get_connection', lambda: conn_cls())
+    migrations.ensure_schema()
+    return cur.statements
+
+
+def test_postgres_listing_filter_indexes(monkeypatch):
+    statements = _run_ensure_schema(monkeypatch, 'psycopg2.extensions')
+    assert ("CREATE INDEX IF NOT EXISTS idx_bikes_sale_type_created_at "
+            "ON bikes (sale_type, created_at DESC, id DESC);") in statements
+    assert ("CREATE INDEX IF NOT EXISTS idx_bikes_sale_price ON bikes (sale_price) "
+            "WHERE sale_price IS NOT NULL;") in statements
+    assert ("CREATE INDEX IF NOT EXISTS idx_bikes_rental_price ON bikes (rental_price) "
+            "WHERE rental_price IS NOT NULL;") in statements
+
+
+def test_mysql_listing_filter_indexes(monkeypatch):
+    statements = _run_ensure_schema(monkeypatch, 'mysql.connector.connection')
+    assert "CREATE INDEX idx_bikes_sale_type_created_at ON bikes (sale_type, created_at, id);" in statements
+    assert "CREATE INDEX idx_bikes_sale_price ON bikes (sale_price);" in statements
+    assert "CREATE INDEX idx_bikes_rental_price ON bikes (rental_price);" in statements
+
+
+def test_conversations_table_is_created_and_backfilled(monkeypatch):
+    pg = _run_ensure_schema(monkeypatch, 'psycopg2.extensions')
+    assert any(s.startswith('CREATE TABLE IF NOT EXISTS conversations') for s in pg)
+    backfill = [s for s in pg if s.startswith('INSERT INTO conversations')]
+    assert len(backfill) == 1 and 'DISTINCT ON' in backfill[0]
+    # runs on every migration, not only into an empty table, and a row only moves to a newer message
+    assert not any(s.startswith('SELECT 1 FROM conversations') for s in pg)
+    assert backfill[0].endswith('WHERE conversations.last_message_id < EXCLUDED.last_message_id')
+    mysql = _run_ensure_schema(monkeypatch, 'mysql.connector.connection')
+    backfill = [s for s in mysql if s.startswith('INSERT INTO conversations')]
+    assert len(backfill) == 1 and 'ROW_NUMBER() OVER' in backfill[0]
+    assert 'last_message_id = GREATEST(last_message_id, VALUES(last_message_id))' in backfill[0]
+
+
+def test_per_participant_message_indexes(monkeypatch):
+    pg = _run_ensure_schema(monkeypatch, 'psycopg2.extensions')
+    assert "CREATE INDEX IF NOT EXISTS idx_messages_sender_created_at ON messages (sender_id, created_at);" in pg
+    assert "CREATE INDEX IF NOT EXISTS idx_messages_receiver_created_at ON messages (receiver_id, created_at);" in pg
+    mysql = _run_ensure_schema(monkeypatch, 'mysql.connector.connection')
+    assert "CREATE INDEX idx_messages_sender_created_at ON messages (sender_id, created_at);" in mysql
+    assert "CREATE INDEX idx_messages_receiver_created_at ON messages (receiver_id, created_at);" in mysql
@@ -0,0 +1,240 @@
+"""
+Unit test: recommender feature matrix
+
+Checks that recommender.FeatureIndex gives the same cosine similarities as a
+brute-force computation, and that upserts/removals keep the id -> row index
+consistent.
+Type: unit test (pure NumPy). No network or real DB required.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import types
+mysql_mod = types.ModuleType('mysql')
+mysql_connector = types.ModuleType('mysql.connector')
+mysql_connector.connect = lambda **kwargs: None
+mysql_mod.connector = mysql_connector
+sys.modules.setdefault('mysql', mysql_mod)
+sys.modules.setdefault('mysql.connector', mysql_connector)
+psycopg2_mod = types.ModuleType('psycopg2')
+psycopg2_mod.connect = lambda *a, **k: None
+sys.modules.setdefault('psycopg2', psycopg2_mod)
+
+import numpy as np
+
+import recommender
+
+ROWS = [
+    (1, 300, None, 'venta', 'Good', 58.97, 5.73),
+    (2, 310, None, 'venta', 'Good', 58.96, 5.71),
+    (3, None, 40, 'alquiler', 'Poor', None, None),
+    (4, 1200, 180, 'ambos', 'Excellent', 60.39, 5.32),
+    (5, 0, 0, 'venta', None, None, None),  # all-zero-ish vector
+]
+
+
+def _brute_force(rows, target_id):
+    features = {row[0]: np.array(recommender.encode(row), dtype=float) for row in rows}
+    t = features[target_id]
+    out = {}
+    for bike_id, f in features.items():
+        if bike_id == target_id:
+            continue
+        denom = np.linalg.norm(t) * np.linalg.norm(f)
+        out[bike_id] = float(t @ f / denom) if denom else 0.0
+    return out
+
+
+def test_similarities_match_brute_force():
+    index = recommender.FeatureIndex.build(ROWS)
+    expected = _brute_force(ROWS, 1)
+    got = dict(index.similar(1, k=10, threshold=-1))
+    assert set(got) == set(expected)
+    for bike_id, score in expected.items():
+        assert abs(got[bike_id] - score) < 1e-9
+    assert index.similar(1, k=1, threshold=0.5)[0][0] == 2
+
+
+def test_upsert_and_remove_keep_index_consistent():
+    index = recommender.FeatureIndex.build(ROWS[:2])
+    for row in ROWS[2:]:
+        index.upsert(row)
+    index.remove(2)
+    index.upsert((1, 1200, 180, 'ambos', 'Excellent', 60.39, 5.32))  # now identical to bike 4
+    assert len(index) == 4 and 2 not in index
+    assert sorted(int(i) for i in index.ids[:index.size]) == [1, 3, 4, 5]
+    best_id, best_score = index.similar(1, k=1, threshold=0)[0]
+    assert best_id == 4 and best_score > 0.999999
+
+
+def _random_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    types_ = ['venta', 'alquiler', 'ambos']
+    conditions = list(recommender.CONDITION_CODES)
+    return [
+        (i, float(rng.uniform(50, 3000)), float(rng.uniform(5, 400)), types_[i % 3],
+         conditions[i % len(conditions)], float(rng.uniform(57, 62)), float(rng.uniform(4, 12)))
+        for i in range(1, n + 1)
+    ]
+
+
+def test_kdtree_matches_brute_force(monkeypatch):
+    rows = _random_rows(2000)
+    brute = recommender.FeatureIndex.build(rows)
+    tree = recommender.FeatureIndex.build(rows)
+    monkeypatch.setenv('RECOMMENDER_INDEX', 'kdtree')
+    # a few writes after the tree is built go through the stale set
+    tree.similar(1, k=5)
+    for index in (brute, tree):
+        index.upsert((7, 900, 120, 'ambos', 'Good', 59.0, 6.0))
+        index.remove(11)
+        index.upsert((5000, 905, 121, 'ambos', 'Good', 59.0, 6.0))
+    for bike_id in (1, 7, 42, 5000):
+        got = tree.similar(bike_id, k=5, threshold=0.2)
+        monkeypatch.setenv('RECOMMENDER_INDEX', 'brute')
+        expected = brute.similar(bike_id, k=5, threshold=0.2)
+        monkeypatch.setenv('RECOMMENDER_INDEX', 'kdtree')
+        assert [b for b, _ in got] == [b for b, _ in expected]
+        assert np.allclose([s for _, s in got], [s for _, s in expected])
+
+
+def test_top_k_honours_k_and_threshold():
+    index = recommender.FeatureIndex.build(_random_rows(200))
+    assert len(index.similar(1, k=7, threshold=-1)) == 7
+    assert all(score > 0.99 for _, score in index.similar(1, k=50, threshold=0.99))
+
+
+def test_similar_many_matches_single_queries(monkeypatch):
+    index = recommender.FeatureIndex.build(_random_rows(500))
+    monkeypatch.setattr(recommender, 'BATCH_CELLS', 1000)  # force several chunks
+    batch = index.similar_many([3, 1, 250, 3], k=4, threshold=0.1)
+    assert list(batch) == [3, 1, 250]
+    for bike_id, recs in batch.items():
+        single = index.similar(bike_id, k=4, threshold=0.1)
+        assert [b for b, _ in recs] == [b for b, _ in single]
+        assert np.allclose([s for _, s in recs], [s for _, s in single])
+
+
+TEXT_ROWS = [
+    (1, 450, None, 'venta', 'Good', 58.97, 5.73, 'Trek Marlin 5', 'Trek Marlin', 'Hardtail, 29er'),
+    (2, 1400, None, 'venta', 'Good', 58.97, 5.73, 'Trek Marlin 7', 'Trek Marlin', 'Barely used'),
+    (3, 1350, None, 'venta', 'Good', 58.97, 5.73, 'City bike', 'Btwin Elops', 'Basket included'),
+    (4, None, 30, 'alquiler', 'Poor', 58.97, 5.73, None, None, None),
+]
+
+
+def test_text_channel_links_same_model_across_prices(monkeypatch):
+    monkeypatch.setenv('RECOMMENDER_TEXT_WEIGHT', '0')
+    numeric_only = recommender.FeatureIndex.build(TEXT_ROWS)
+    assert numeric_only.text is None
+    assert numeric_only.similar(2, k=1)[0][0] != 1
+
+    monkeypatch.setenv('RECOMMENDER_TEXT_WEIGHT', '0.5')
+    index = recommender.FeatureIndex.build(TEXT_ROWS)
+    assert index.similar(2, k=1)[0][0] == 1
+    # no text on bike 4: numeric score only, against anyone
+    assert dict(index.similar(4, k=3, threshold=-1)) == dict(numeric_only.similar(4, k=3, threshold=-1))
+
+
+def test_text_overlay_matches_folded_matrix(monkeypatch):
+    monkeypatch.setenv('RECOMMENDER_TEXT_WEIGHT', '0.5')
+    rows = [row + (f'Bike {row[0] % 7}', ['Trek', 'Giant', 'Cube'][row[0] % 3], f'size {row[0] % 4}')
+            for row in _random_rows(300)]
+    overlaid = recommender.FeatureIndex.build(rows)
+    folded = recommender.FeatureIndex.build(rows)
+    for index in (overlaid, folded):
+        index.upsert((5, 900, 120, 'ambos', 'Good', 59.0, 6.0, 'Giant TCR', 'Giant', 'carbon'))
+        index.upsert((400, 905, 121, 'ambos', 'Good', 59.0, 6.0, 'Giant TCR Advanced', 'Giant', 'unseen words'))
+        index.remove(17)
+    folded.text.fold()
+    assert overlaid.text.overlay and not folded.text.overlay
+    for bike_id in (1, 5, 400, 300):
+        got = overlaid.similar(bike_id, k=5, threshold=0)
+        expected = folded.similar(bike_id, k=5, threshold=0)
+        assert [b for b, _ in got] == [b for b, _ in expected]
+        assert np.allclose([s for _, s in got], [s for _, s in expected])
+
+
+class _TableConn:
+    """Answers recommender's `WHERE id IN (...)` lookups from a dict of rows."""
+
+    def __init__(self, rows):
+        self.table = {row[0]: row for row in rows}
+
+    def cursor(self):
+        conn = self
+
+        class Cursor:
+            def execute(self, sql, params=()):
+                self.rows = [conn.table[i] for i in params if i in conn.table]
+
+            def fetchall(self):
+                return self.rows
+
+        return Cursor()
+
+
+def test_stale_worker_replays_logged_changes(monkeypatch):
+    recommender.reset()
+    conn = _TableConn(ROWS)
+    monkeypatch.setattr(recommender.cache, 'catalog_version', lambda: 1)
+    monkeypatch.setattr(recommender, 'build_index', lambda c: recommender.FeatureIndex.build(ROWS))
+    index = recommender.get_index(conn)
+
+    # another worker updated bike 1 and deleted bike 3 (versions 2 and 3)
+    conn.table[1] = (1, 1200, 180, 'ambos', 'Excellent', 60.39, 5.32)
+    del conn.table[3]
+    monkeypatch.setattr(recommender.cache, 'catalog_version', lambda: 3)
+    monkeypatch.setattr(recommender.cache, 'catalog_changes',
+                        lambda since, until: ([1, 3], 3) if (since, until) == (1, 3) else None)
+    def _no_rebuild(c):
+        raise AssertionError('full rebuild instead of replay')
+    monkeypatch.setattr(recommender, 'build_index', _no_rebuild)
+    assert recommender.get_index(conn) is index
+    assert 3 not in index and index.similar(1, k=1, threshold=0)[0][0] == 4
+
+    # a gap in the log falls back to one rebuild
+    rebuilt = []
+    monkeypatch.setattr(recommender.cache, 'catalog_version', lambda: 9)
+    monkeypatch.setattr(recommender, 'build_index', lambda c: rebuilt.append(1) or recommender.FeatureIndex.build(ROWS))
+    assert recommender.get_index(conn) is not index and rebuilt == [1]
+    recommender.reset()
+
+
+def test_kdtree_with_text_matches_brute_force(monkeypatch):
+    monkeypatch.setenv('RECOMMENDER_TEXT_WEIGHT', '0.4')
+    models = ['Trek Marlin', 'Giant TCR', 'Cube Aim', 'Btwin Elops', 'Specialized Turbo']
+    rows = [row + (f'{models[row[0] % 5]} {row[0] % 11}', models[row[0] % 5], f'size {row[0] % 4} lot{row[0] % 97}')
+            for row in _random_rows(2000)]
+    rows[40] = rows[40][:7] + (None, None, None)  # no text at all
+    brute = recommender.FeatureIndex.build(rows)
+    tree = recommender.FeatureIndex.build(rows)
+    monkeypatch.setenv('RECOMMENDER_INDEX', 'kdtree')
+    # start from k + 1 neighbours so the widening is exercised too
+    monkeypatch.setattr(recommender, 'TREE_TEXT_NEIGHBOURS', 0)
+    tree.similar(1, k=5)
+    scanned = []
+    scan = tree._similar_scan
+    monkeypatch.setattr(tree, '_similar_scan', lambda ids, *a: scanned.extend(ids) or scan(ids, *a))
+    for index in (brute, tree):
+        index.upsert((7, 900, 120, 'ambos', 'Good', 59.0, 6.0, 'Giant TCR', 'Giant', 'carbon'))
+        index.remove(11)
+        index.upsert((5000, 905, 121, 'ambos', 'Good', 59.0, 6.0, 'Cube Aim 3', 'Cube', 'unseen words'))
+    for bike_id in (1, 7, 41, 42, 777, 5000):
+        for k, threshold in ((5, 0.2), (20, 0.6)):
+            got = tree.similar(bike_id, k=k, threshold=threshold)
+            monkeypatch.setenv('RECOMMENDER_INDEX', 'brute')
+            expected = brute.similar(bike_id, k=k, threshold=threshold)
+            monkeypatch.setenv('RECOMMENDER_INDEX', 'kdtree')
+            assert np.allclose([s for _, s in got], [s for _, s in expected])
+            assert [b for b, _ in got] == [b for b, _ in expected]
+    assert scanned == []  # answered by the tree, not a fallback scan
+
+    # too many candidates: the query scans instead, with the same answer
+    monkeypatch.setattr(recommender, 'TREE_SCAN_FRACTION', 0)
+    got = tree.similar(42, k=5, threshold=0.2)
+    monkeypatch.setenv('RECOMMENDER_INDEX', 'brute')
+    assert got == brute.similar(42, k=5, threshold=0.2) and scanned == [42]
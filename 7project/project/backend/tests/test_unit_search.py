@@ -0,0 +1,112 @@
+"""
+Unit test: search clause builder
+
+Checks that search.search_clause picks the full-text path on PostgreSQL when
+the search_tsv column exists and falls back to LIKE elsewhere.
+Type: unit test. No network or real DB required.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import types
+mysql_mod = types.ModuleType('mysql')
+mysql_connector = types.ModuleType('mysql.connector')
+mysql_connector.connect = lambda **kwargs: None
+mysql_mod.connector = mysql_connector
+sys.modules.setdefault('mysql', mysql_mod)
+sys.modules.setdefault('mysql.connector', mysql_connector)
+psycopg2_mod = types.ModuleType('psycopg2')
+psycopg2_mod.connect = lambda *a, **k: None
+sys.modules.setdefault('psycopg2', psycopg2_mod)
+
+import search
+
+
+class _Cursor:
+    def execute(self, sql, params=None):
+        self.sql = sql
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return [(1,)]
+
+
+PGConn = type('PGConn', (), {'__module__': 'psycopg2.extensions', 'cursor': lambda self: _Cursor()})
+MySQLConn = type('MySQLConn', (), {'__module__': 'mysql.connector.connection', 'cursor': lambda self: _Cursor()})
+OtherConn = type('OtherConn', (), {'__module__': 'sqlite3', 'cursor': lambda self: _Cursor()})
+
+
+def test_search_clause_uses_tsquery_on_postgres(monkeypatch):
+    monkeypatch.setattr(search, '_fts_ready', {})
+    where, params, rank, rank_params = search.search_clause(PGConn(), 'Trek  marlin!')
+    assert 'search_tsv @@' in where
+    assert params[0] == 'trek:* & marlin:*'
+    assert rank.startswith('ts_rank')
+    assert rank_params == ['trek:* & marlin:*']
+
+
+def test_search_clause_keeps_owner_substring_match(monkeypatch):
+    monkeypatch.setattr(search, '_fts_ready', {})
+    where, params, _, _ = search.search_clause(PGConn(), 'ola')
+    assert 'name LIKE %s' in where
+    assert params == ['ola:*', '%ola%']
+
+
+def test_search_clause_mysql_keeps_match_out_of_or(monkeypatch):
+    monkeypatch.setattr(search, '_fts_ready', {})
+    where, params, rank, _ = search.search_clause(MySQLConn(), 'trek marlin')
+    # FULLTEXT can only drive the lookup as its own branch, never under an OR
+    assert ' OR ' not in where
+    assert 'UNION' in where and 'MATCH(title, model, description)' in where
+    assert params == ['+trek* +marlin*', '%trek marlin%']
+    assert rank.startswith('MATCH(')
+
+
+def test_search_clause_like_fallback():
+    where, params, rank, _ = search.search_clause(OtherConn(), 'trek')
+    assert 'LIKE' in where
+    assert params == ['%trek%'] * 3
+    assert rank is None
+
+
+def test_search_mode_env_forces_like(monkeypatch):
+    monkeypatch.setattr(search, '_fts_ready', {})
+    monkeypatch.setenv('SEARCH_MODE', 'like')
+    _, _, rank, _ = search.search_clause(PGConn(), 'trek')
+    assert rank is None
+
+
+class _SqliteAsPG:
+    """sqlite behind a psycopg2-looking connection, with LIKE made case-sensitive as on PostgreSQL."""
+    __module__ = 'psycopg2.extensions'
+
+    def __init__(self):
+        import sqlite3
+        self.db = sqlite3.connect(':memory:')
+        self.db.execute('PRAGMA case_sensitive_like = ON')
+        self.db.execute('CREATE TABLE bikes (title TEXT, model TEXT)')
+
+    def cursor(self):
+        db = self.db
+
+        class Cursor:
+            def execute(self, sql, params=()):
+                self.rows = db.execute(sql.replace('%s', '?'), params).fetchall()
+
+            def fetchall(self):
+                return self.rows
+
+        return Cursor()
+
+
+def test_suggest_prefix_fallback_ignores_case(monkeypatch):
+    monkeypatch.setattr(search, '_trgm_available', lambda conn: False)
+    conn = _SqliteAsPG()
+    conn.db.executemany('INSERT INTO bikes VALUES (?, ?)', [('trek marlin', 'Marlin 5'), ('City bike', 'TREKKING')])
+    values = {s['value'] for s in search.suggest(conn, 'Tre', 10)}
+    assert values == {'trek marlin', 'TREKKING'}
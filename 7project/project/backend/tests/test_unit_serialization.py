@@ -0,0 +1,33 @@
+"""
+Unit test: row serialization plans
+
+Checks that serialization.RowPlan maps rows like the old hand-written dict
+builders (NULLs kept, converters applied, offset honoured) and that dumps()
+round-trips through json.
+Type: unit test. No network or real DB required.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import datetime
+import json
+from decimal import Decimal
+
+from serialization import RowPlan, dumps, to_float, to_iso
+
+
+def test_row_plan_converts_and_keeps_nulls():
+    plan = RowPlan([('id', None), ('price', to_float), ('created_at', to_iso)], offset=1)
+    row = ('skipped', 7, Decimal('12.50'), datetime.datetime(2024, 5, 1, 12, 0))
+    assert plan(row) == {'id': 7, 'price': 12.5, 'created_at': '2024-05-01T12:00:00'}
+    assert plan.many([('x', 8, None, None)]) == [{'id': 8, 'price': None, 'created_at': None}]
+    assert plan.names == ('id', 'price', 'created_at')
+
+
+def test_dumps_returns_compact_json_bytes():
+    body = dumps({'bikes': [{'id': 1, 'title': 'Sykkel ø'}], 'count': 1})
+    assert isinstance(body, bytes)
+    assert json.loads(body) == {'bikes': [{'id': 1, 'title': 'Sykkel ø'}], 'count': 1}
@@ -0,0 +1,85 @@
+"""
+Unit test: shared memory-mapped snapshots
+
+Checks that shared_arrays.publish() swaps the `current` snapshot atomically
+and keeps only the previous one, that recommender.FeatureIndex round-trips
+through a snapshot (copy-on-write, so a worker's writes never reach the file),
+and that the build lock is exclusive.
+Type: unit test (temporary directory). No network or real DB required.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import types
+mysql_mod = types.ModuleType('mysql')
+mysql_connector = types.ModuleType('mysql.connector')
+mysql_connector.connect = lambda **kwargs: None
+mysql_mod.connector = mysql_connector
+sys.modules.setdefault('mysql', mysql_mod)
+sys.modules.setdefault('mysql.connector', mysql_connector)
+psycopg2_mod = types.ModuleType('psycopg2')
+psycopg2_mod.connect = lambda *a, **k: None
+sys.modules.setdefault('psycopg2', psycopg2_mod)
+
+import numpy as np
+
+import recommender
+import shared_arrays
+
+
+def test_publish_swaps_current_and_prunes(tmp_path):
+    root = str(tmp_path)
+    assert shared_arrays.current_path(root) is None
+    paths = [shared_arrays.publish(root, {'a': np.arange(3) + n}, {'n': n}) for n in range(3)]
+    assert shared_arrays.current_path(root) == paths[-1]
+    assert shared_arrays.read_meta(paths[-1]) == {'n': 2}
+    assert list(shared_arrays.load(paths[-1], 'a')) == [2, 3, 4]
+    # the previous snapshot survives for readers that resolved the link before the swap
+    assert not os.path.exists(paths[0]) and os.path.exists(paths[1])
+
+
+def test_build_lock_is_exclusive(tmp_path):
+    with shared_arrays.build_lock(str(tmp_path)) as held:
+        assert held
+        with shared_arrays.build_lock(str(tmp_path), blocking=False) as other:
+            assert not other
+    with shared_arrays.build_lock(str(tmp_path), blocking=False) as again:
+        assert again
+
+
+def _rows(n):
+    # unsorted ids on purpose: snapshots sort them for the binary search
+    return [
+        (i, float(50 + (i * 37) % 900), None, ['venta', 'alquiler', 'ambos'][i % 3], 'Good',
+         58.0 + i % 5, 6.0, f'Bike {i % 7}', ['Trek', 'Giant', 'Cube'][i % 3], f'size {i % 4}')
+        for i in range(n, 0, -1)
+    ]
+
+
+def test_feature_index_round_trips_through_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setenv('RECOMMENDER_TEXT_WEIGHT', '0.3')
+    built = recommender.FeatureIndex.build(_rows(300))
+    arrays, meta = built.snapshot()
+    path = shared_arrays.publish(str(tmp_path), arrays, meta)
+    mapped = recommender.FeatureIndex.from_snapshot(path, shared_arrays.read_meta(path))
+    assert isinstance(mapped.matrix, np.memmap)
+
+    writes = [(1000, 120.0, None, 'venta', 'Good', 58.0, 6.0, 'Trek Bike', 'Trek', ''),
+              (7, 10.0, None, 'venta', 'Poor', 0, 0, 'Old frame', '', '')]
+    for index in (built, mapped):
+        for row in writes:
+            index.upsert(row)
+        index.remove(5)
+    for bike_id in (1, 7, 150, 1000):
+        got = mapped.similar(bike_id, k=5, threshold=0)
+        expected = built.similar(bike_id, k=5, threshold=0)
+        assert [b for b, _ in got] == [b for b, _ in expected]
+        assert np.allclose([s for _, s in got], [s for _, s in expected])
+
+    # copy-on-write: the file (and every other worker's view) is untouched
+    again = recommender.FeatureIndex.from_snapshot(path, shared_arrays.read_meta(path))
+    assert 5 in again and 1000 not in again and 5 not in mapped